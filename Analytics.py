@@ -0,0 +1,136 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from Metrics import ANALYTICS_SECONDS, timer
+from db import HISTORY_TABLE, METRICS_TABLE, month_start, shift_month
+
+logger = logging.getLogger(__name__)
+
+# Janela da média móvel, em meses de calendário
+ROLLING_MONTHS = 3
+
+# Colunas calculadas só com a própria série (region, game) e as que dependem do corte região x mês
+SERIES_COLUMNS = ['revenue', 'mom_growth', 'rolling_avg']
+CROSS_SECTION_COLUMNS = ['rank', 'rank_change', 'region_share']
+
+# Espaço reservado para os meses na chave (série, mês) usada nas buscas binárias
+MONTH_KEY_SPAN = 1_000_000
+
+
+# Índice inteiro de cada mês (ano * 12 + mês), para aritmética de meses vetorizada
+def month_index(months):
+    months = pd.to_datetime(pd.Series(months))
+    return (months.dt.year * 12 + months.dt.month - 1).to_numpy(dtype='int64')
+
+
+# Ordena por série e mês e devolve (frame, código da série, índice do mês, linha anterior é o mês anterior da série)
+def sorted_series(frame):
+    frame = frame.sort_values(['region', 'game', 'month'], ignore_index=True)
+    codes = frame.groupby(['region', 'game'], sort=False, observed=True).ngroup().to_numpy(dtype='int64')
+    months = month_index(frame['month'])
+    follows = np.r_[False, (codes[1:] == codes[:-1]) & (months[1:] - months[:-1] == 1)]
+    return frame, codes, months, follows
+
+
+# Crescimento mês a mês e média móvel de window meses de cada série, com operações vetorizadas.
+# Espera uma linha por (region, game, month); meses faltando não são interpolados (crescimento fica nulo
+# e a média usa só os meses observados dentro da janela).
+def series_metrics(history, window=ROLLING_MONTHS):
+    frame, codes, months, follows = sorted_series(history[['region', 'game', 'month', 'revenue']])
+    if frame.empty:
+        return frame.assign(mom_growth=pd.Series(dtype='float64'), rolling_avg=pd.Series(dtype='float64'))
+    revenue = frame['revenue'].to_numpy(dtype='float64')
+
+    previous = np.r_[np.nan, revenue[:-1]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frame['mom_growth'] = np.where(follows & (previous > 0), revenue / previous - 1, np.nan)
+
+    # Soma acumulada + busca binária do início da janela na chave ordenada (série, mês)
+    key = codes * MONTH_KEY_SPAN + months
+    start = np.searchsorted(key, key - (window - 1), side='left')
+    observed = ~np.isnan(revenue)
+    sums = np.r_[0.0, np.cumsum(np.where(observed, revenue, 0.0))]
+    counts = np.r_[0, np.cumsum(observed)]
+    end = np.arange(1, len(frame) + 1)
+    window_counts = counts[end] - counts[start]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frame['rolling_avg'] = np.where(window_counts > 0, (sums[end] - sums[start]) / window_counts, np.nan)
+    return frame
+
+
+# Posição de cada jogo no ranking da sua região em cada mês (1 = maior receita), variação da posição em relação
+# ao mês anterior (positiva = subiu) e participação na receita da região. Precisa dos cortes região x mês completos.
+def cross_section_metrics(frame):
+    frame, _, _, follows = sorted_series(frame)
+    if frame.empty:
+        return frame.assign(rank=pd.Series(dtype='Int64'), rank_change=pd.Series(dtype='Int64'),
+                            region_share=pd.Series(dtype='float64'))
+    by_region_month = frame.groupby(['region', 'month'], sort=False, observed=True)['revenue']
+
+    rank = by_region_month.rank(method='min', ascending=False)
+    frame['rank'] = rank.astype('Int64')
+    previous_rank = np.r_[np.nan, rank.to_numpy(dtype='float64')[:-1]]
+    frame['rank_change'] = pd.array(np.where(follows, previous_rank - rank.to_numpy(), np.nan), dtype='Int64')
+
+    totals = by_region_month.transform('sum')
+    frame['region_share'] = frame['revenue'] / totals.where(totals > 0)
+    return frame
+
+
+# Todas as métricas a partir do histórico em formato longo (region, game, month, revenue)
+def compute_metrics(history, window=ROLLING_MONTHS):
+    return cross_section_metrics(series_metrics(history, window))
+
+
+# Recalcula todas as métricas a partir do histórico e substitui a tabela materializada
+@timer(ANALYTICS_SECONDS, mode='rebuild')
+def rebuild_metrics(db, history_table=HISTORY_TABLE, table_name=METRICS_TABLE, window=ROLLING_MONTHS):
+    history = db.fetch_history_series(history_table)
+    metrics = compute_metrics(history, window)
+    if not db.write_metrics(table_name, metrics, SERIES_COLUMNS + CROSS_SECTION_COLUMNS, replace=True):
+        raise RuntimeError("Falha ao gravar as métricas.")
+    n_series = len(metrics[['region', 'game']].drop_duplicates())
+    logger.info("Métricas recalculadas: %d séries, %d linhas.", n_series, len(metrics), extra={'rows': len(metrics)})
+    return len(metrics)
+
+
+# Atualiza as métricas depois de uma coleta, recalculando só o que ela pode ter mudado:
+# - crescimento e média móvel das séries (region, game) presentes em changed;
+# - rank, variação do rank e participação dos cortes região x mês das regiões afetadas nos meses da coleta
+#   (e no mês seguinte, cuja variação do rank depende deles), lidos da própria tabela de métricas.
+@timer(ANALYTICS_SECONDS, mode='incremental')
+def update_metrics(db, changed, months, history_table=HISTORY_TABLE, table_name=METRICS_TABLE,
+                   window=ROLLING_MONTHS):
+    series = changed[['region', 'game']].dropna().astype(str).drop_duplicates()
+    months = sorted({month_start(month) for month in months})
+    if series.empty or not months:
+        return 0
+
+    history = db.fetch_history_series(history_table, series)
+    if history.empty:
+        return 0
+    if not db.write_metrics(table_name, series_metrics(history, window), SERIES_COLUMNS):
+        raise RuntimeError("Falha ao gravar as métricas das séries alteradas.")
+
+    regions = sorted(series['region'].unique())
+    updated = sorted(set(months) | {shift_month(month, 1) for month in months})
+    sections = db.fetch_metrics(table_name, regions, sorted(set(updated) | {shift_month(m, -1) for m in months}),
+                                ['region', 'game', 'month', 'revenue'])
+    sections = cross_section_metrics(sections)
+    sections = sections[sections['month'].isin(updated)]
+    if not db.write_metrics(table_name, sections, CROSS_SECTION_COLUMNS):
+        raise RuntimeError("Falha ao gravar rank e participação das regiões alteradas.")
+
+    logger.info("Métricas atualizadas: %d séries e %d linhas de %d regiões.", len(series), len(sections),
+                len(regions), extra={'rows': len(series)})
+    return len(series)
+
+
+# Cria a tabela de métricas e, se ela nunca foi gravada (versão 0), calcula tudo a partir do histórico
+def ensure_metrics(db, history_table=HISTORY_TABLE, table_name=METRICS_TABLE):
+    db.create_metrics_table(table_name)
+    if db.fetch_data_version(table_name) == 0:
+        return rebuild_metrics(db, history_table, table_name)
+    return 0
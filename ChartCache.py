@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.io as pio
+
+from Metrics import inc
+
+logger = logging.getLogger(__name__)
+
+# Diretório padrão do cache de figuras em disco (variável de ambiente CHART_CACHE_DIR), compartilhado pelos workers
+CHART_CACHE_DIR = os.environ.get('CHART_CACHE_DIR', '.chart_cache')
+
+# Sufixos que ChartGenerator.data_version acrescenta à versão dos dados: filtros (-f<hash>) e top-N (-n<N>)
+VERSION_SUFFIX = re.compile(r'(-f[0-9a-f]+)?-n[^-]+$')
+DB_VERSION = re.compile(r'^db-(?P<table>.+)-(?P<number>\d+)$')
+
+
+# Versão dos dados de um DataFrame: hash do conteúdo e dos nomes das colunas
+def frame_version(data):
+    digest = hashlib.sha256(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    digest.update('\x1f'.join(map(str, data.columns)).encode('utf-8'))
+    return f"df-{digest.hexdigest()[:16]}"
+
+
+# Versão dos dados sem os sufixos de filtro e top-N (ex.: "db-gacha_revenue-7-f1a2b3c4-n25" -> "db-gacha_revenue-7")
+def base_version(version):
+    return VERSION_SUFFIX.sub('', version)
+
+
+# Se figuras da versão old ficaram obsoletas com a chegada de new: versões do banco da mesma tabela com número
+# menor, ou outro hash de DataFrame. Variantes de filtro/top-N dos mesmos dados nunca são obsoletas entre si.
+def supersedes(new, old):
+    new_base, old_base = base_version(new), base_version(old)
+    if new_base == old_base:
+        return False
+    new_db, old_db = DB_VERSION.match(new_base), DB_VERSION.match(old_base)
+    if new_db and old_db:
+        return new_db['table'] == old_db['table'] and int(old_db['number']) < int(new_db['number'])
+    return new_db is None and old_db is None
+
+
+class FigureCache:
+    # Cache de figuras em dois níveis: LRU em memória e JSON serializado em disco
+    def __init__(self, max_entries=64, cache_dir=CHART_CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    # Caminho do arquivo de uma figura no disco
+    def disk_path(self, version, chart_name):
+        return os.path.join(self.cache_dir, f"{chart_name}--{version}.json")
+
+    # Busca a figura na memória e depois no disco; retorna None se não houver
+    def get(self, version, chart_name):
+        key = (version, chart_name)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                inc('chart_cache_requests_total', result='memory_hit')
+                return self.entries[key]
+
+        if self.cache_dir:
+            path = self.disk_path(version, chart_name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    fig = pio.from_json(f.read())
+            except (OSError, ValueError):
+                fig = None
+            if fig is not None:
+                self.remember(key, fig)
+                with self.lock:
+                    self.hits += 1
+                inc('chart_cache_requests_total', result='disk_hit')
+                return fig
+
+        with self.lock:
+            self.misses += 1
+        inc('chart_cache_requests_total', result='miss')
+        return None
+
+    # Guarda a figura nos dois níveis e descarta as de dados mais antigos do mesmo gráfico.
+    # O disco é compartilhado entre threads e processos: falhas nele só são registradas (a figura fica na memória).
+    def put(self, version, chart_name, fig):
+        if fig is None:
+            return
+        self.remember((version, chart_name), fig)
+        if self.cache_dir:
+            try:
+                self.invalidate(chart_name, current_version=version, memory=False)
+                self.write_disk(version, chart_name, fig)
+            except OSError as e:
+                logger.warning("Cache em disco indisponível para '%s' (%s); figura mantida só em memória.",
+                               chart_name, e)
+
+    # Grava a figura em um arquivo temporário próprio e o move para o lugar (escritores concorrentes não colidem)
+    def write_disk(self, version, chart_name, fig):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f"{chart_name}--", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(fig.to_json())
+            os.replace(tmp_path, self.disk_path(version, chart_name))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    # Insere na LRU em memória, removendo entradas de dados mais antigos do mesmo gráfico e excedentes
+    # (as variantes de filtro dos dados atuais ficam, limitadas pelo tamanho da LRU)
+    def remember(self, key, fig):
+        version, chart_name = key
+        with self.lock:
+            for stale in [k for k in self.entries if k[1] == chart_name and supersedes(version, k[0])]:
+                del self.entries[stale]
+            self.entries[key] = fig
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    # Remove figuras (de um gráfico ou todas); com current_version, só as de dados mais antigos que ela
+    def invalidate(self, chart_name=None, current_version=None, memory=True):
+        def stale(version, name):
+            return (chart_name is None or name == chart_name) and (
+                current_version is None or supersedes(current_version, version)
+            )
+
+        if memory:
+            with self.lock:
+                for key in [k for k in self.entries if stale(*k)]:
+                    del self.entries[key]
+
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            for filename in os.listdir(self.cache_dir):
+                if not filename.endswith('.json') or '--' not in filename:
+                    continue
+                name, version = filename[:-len('.json')].split('--', 1)
+                if stale(version, name):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, filename))
+                    except OSError:
+                        pass
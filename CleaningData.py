@@ -1,5 +1,16 @@
+import logging
+
 import pandas as pd
 
+from Metrics import STAGE_SECONDS, inc, timer
+
+logger = logging.getLogger(__name__)
+
+# Símbolos exibidos na coluna de região e seus códigos
+REGION_SYMBOLS = {
+    '🇯🇵': "jp", '🇨🇳': "cn", '🇰🇷': "kr", '🇺🇸': "us", '☠️': 0, '🌐': 'WW'
+}
+
 class DataCleaner:
     def __init__(self, data: pd.DataFrame):
         self.data = data
@@ -7,11 +18,12 @@ class DataCleaner:
     def clean_numeric_column(self, column: pd.Series) -> pd.Series:
         """Limpa e converte valores monetários em uma coluna para numérico."""
         if column.dtype == 'object':
-            # Remove símbolos de moeda e vírgulas, depois converte para numérico
-            column = column.replace({r'\$': '', r',': ''}, regex=True).apply(pd.to_numeric, errors='coerce')
+            # Remove símbolos de moeda e vírgulas em uma única passada e converte a Series inteira
+            column = pd.to_numeric(column.astype(str).str.replace(r'[$,]', '', regex=True), errors='coerce')
         # Preenche NaNs com 0 (ou use outra estratégia, se necessário)
         return column.fillna(0)
 
+    @timer(STAGE_SECONDS, stage='cleaning')
     def clean_data(self) -> pd.DataFrame:
         # Valida colunas essenciais
         expected_columns = ['Region', 'Game', 'Last Month', 'Current Month']
@@ -20,11 +32,6 @@ class DataCleaner:
         if missing_columns:
             raise ValueError(f"Colunas ausentes no DataFrame: {missing_columns}")
 
-        # Substitui símbolos por strings
-        self.data.replace({
-            '🇯🇵': "jp", '🇨🇳': "cn", '🇰🇷': "kr", '🇺🇸': "us", '☠️': 0, '🌐': 'WW'
-        }, inplace=True)
-
         # Renomeia colunas para consistência
         self.data.rename(columns={
             'Last Month': 'previous_month',
@@ -33,6 +40,11 @@ class DataCleaner:
             'Game': 'game'
         }, inplace=True)
 
+        # Substitui símbolos por códigos só na coluna de região (mapeando apenas as categorias)
+        region = self.data['region'].astype('category')
+        self.data['region'] = region.map(lambda value: REGION_SYMBOLS.get(value, value)).astype('category')
+        self.data['game'] = self.data['game'].astype('category')
+
         # Limpa e converte colunas numéricas
         self.data['previous_month'] = self.clean_numeric_column(self.data['previous_month'])
         self.data['current_month'] = self.clean_numeric_column(self.data['current_month'])
@@ -44,18 +56,23 @@ class DataCleaner:
         else:
             raise ValueError("Coluna 'region' não encontrada no DataFrame.")
 
-        # Imprime os nomes das colunas após a limpeza
-        print(f"Colunas após a limpeza (Banco de Dados): {self.data.columns}")
+        # Registra os nomes das colunas após a limpeza (um registro por chamada, não por linha)
+        inc('rows_cleaned_total', len(self.data))
+        logger.debug("Colunas após a limpeza (Banco de Dados): %s", list(self.data.columns))
         return self.data
 
     def clean_data_graph(self) -> pd.DataFrame:
         # Limpeza de dados textuais para melhor legibilidade nos gráficos
-        print("Colunas no DataFrame (Gráficos):", self.data.columns)
+        logger.debug("Colunas no DataFrame (Gráficos): %s", list(self.data.columns))
 
-        # Remove quebras de linha e elimina espaços extras do texto
-        self.data['game'] = self.data['game'].str.replace('\n', ' ', regex=True).str.strip()
-        self.data['region'] = self.data['region'].str.strip()
+        # Remove quebras de linha e elimina espaços extras do texto (só nas categorias, não em cada linha)
+        self.data['game'] = self.data['game'].astype('category').map(
+            lambda value: value.replace('\n', ' ').strip() if isinstance(value, str) else value
+        ).astype('category')
+        self.data['region'] = self.data['region'].astype('category').map(
+            lambda value: value.strip() if isinstance(value, str) else value
+        ).astype('category')
 
-        # Imprime os nomes das colunas após a limpeza para os gráficos
-        print(f"Colunas após a limpeza (Gráficos): {self.data.columns}")
+        # Registra os nomes das colunas após a limpeza para os gráficos
+        logger.debug("Colunas após a limpeza (Gráficos): %s", list(self.data.columns))
         return self.data
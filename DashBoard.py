@@ -1,11 +1,108 @@
+import time
+
 import dash
-from dash import dcc, html
+from dash import dcc, html, Input, Output, State, no_update
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc  # Importar Bootstrap Components
+from flask import Response, g, request
+
+from CleaningData import DataCleaner
+from Graficos import CHART_BUILDERS, METRIC_CHARTS, ChartGenerator, MetricsChartGenerator
+from Metrics import REGISTRY, RENDER_SECONDS, record
+
+# Intervalo padrão de atualização do dashboard, em segundos
+REFRESH_INTERVAL = 60
+
+# Requisições do Dash medidas em dashboard_render_seconds, pela parte renderizada
+RENDER_PATHS = {'/': 'page', '/_dash-layout': 'layout', '/_dash-update-component': 'callback'}
+
+
+# Linha com um gráfico (vazio até o primeiro callback, se não houver figura inicial)
+def chart_row(name, chart):
+    return dbc.Row(
+        dbc.Col(
+            dcc.Graph(
+                id=name,
+                figure=chart if chart is not None else {},
+                config={"displayModeBar": False},
+                style={
+                    'backgroundColor': '#2d2d2d',  # Fundo escuro para gráficos
+                    'color': 'white',  # Texto branco dentro do gráfico
+                    'border': '1px solid #444444',  # Borda escura
+                    'padding': '10px'  # Padding para os gráficos
+                }
+            ),
+            style={'marginBottom': '20px'}
+        ),
+        className="mb-4"
+    )
+
+
+# Filtros de região e jogo
+def filter_row():
+    return dbc.Row(
+        [
+            dbc.Col(dcc.Dropdown(id='region-filter', multi=True, placeholder="Filtrar por região"), md=4),
+            dbc.Col(dcc.Dropdown(id='game-filter', multi=True, placeholder="Filtrar por jogo"), md=8)
+        ],
+        className="mb-4",
+        style={'color': 'black'}  # Texto escuro dentro dos menus
+    )
+
+
+# Opções de um filtro a partir de uma agregação do banco
+def filter_options(aggregate, column):
+    if aggregate.empty:
+        return []
+    return sorted(aggregate[column].dropna().unique())
+
+
+# Cria o app do dashboard; nada é instanciado na importação do módulo
+def create_app(charts=None, db=None, table_name='gacha_revenue', refresh_interval=REFRESH_INTERVAL, cache=None,
+               snapshots=None, metrics_table=None):
+    # Inicializar o app com o tema escuro do Bootstrap
+    app = dash.Dash(__name__, external_stylesheets=[dbc.themes.DARKLY])  # Tema escuro
+    init_dashboard(app, charts, db, table_name, refresh_interval, cache, snapshots, metrics_table)
+    instrument_server(app.server)
+    return app
+
+
+# Mede a renderização da página, do layout e dos callbacks e expõe as métricas do processo em /metrics
+def instrument_server(server):
+    @server.before_request
+    def start_timer():
+        g.render_start = time.perf_counter()
+
+    @server.after_request
+    def stop_timer(response):
+        part = RENDER_PATHS.get(request.path)
+        if part is not None and 'render_start' in g:
+            record(RENDER_SECONDS, time.perf_counter() - g.render_start, part=part, status_code=response.status_code)
+        return response
 
-# Inicializar o app com o tema escuro do Bootstrap
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.DARKLY])  # Tema escuro
+    @server.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_dashboard(app, charts=None, db=None, table_name='gacha_revenue', refresh_interval=REFRESH_INTERVAL,
+                   cache=None, snapshots=None, metrics_table=None):
+    charts = charts or {}
+    live = db is not None
+    with_metrics = live and metrics_table is not None
+
+    # Com banco de dados, os gráficos são atualizados por callbacks; sem ele, o layout é estático
+    controls = [
+        filter_row(),
+        dcc.Interval(id='refresh-interval', interval=refresh_interval * 1000),
+        dcc.Store(id='dashboard-state')
+    ] if live else []
+    chart_names = list(CHART_BUILDERS) if live else list(charts)
+    # Gráficos das métricas materializadas (crescimento, ranking e participação), com estado próprio
+    if with_metrics:
+        controls.append(dcc.Store(id='metrics-state'))
+        chart_names += list(METRIC_CHARTS)
 
-def init_dashboard(charts):
     app.layout = dbc.Container(
         [
             dbc.Row(
@@ -15,25 +112,8 @@ def init_dashboard(charts):
                 ),
                 className="mb-4"
             ),
-            *[
-                dbc.Row(
-                    dbc.Col(
-                        dcc.Graph(
-                            figure=chart,
-                            config={"displayModeBar": False},
-                            style={
-                                'backgroundColor': '#2d2d2d',  # Fundo escuro para gráficos
-                                'color': 'white',  # Texto branco dentro do gráfico
-                                'border': '1px solid #444444',  # Borda escura
-                                'padding': '10px'  # Padding para os gráficos
-                            }
-                        ),
-                        style={'marginBottom': '20px'}
-                    ),
-                    className="mb-4"
-                )
-                for chart in charts.values()
-            ]
+            *controls,
+            *[chart_row(name, charts.get(name)) for name in chart_names]
         ],
         fluid=True,  # Tornar o layout responsivo
         style={
@@ -43,4 +123,92 @@ def init_dashboard(charts):
         }
     )
 
+    if live:
+        register_callbacks(app, db, table_name, cache, snapshots)
+    if with_metrics:
+        register_metric_callbacks(app, db, metrics_table)
+
+
+# Registra o callback que atualiza filtros e gráficos a cada intervalo;
+# com o banco fora do ar, os gráficos vêm do snapshot local mais recente (se houver)
+def register_callbacks(app, db, table_name, cache=None, snapshots=None):
+    @app.callback(
+        [
+            Output('dashboard-state', 'data'),
+            Output('region-filter', 'options'),
+            Output('game-filter', 'options'),
+            *[Output(name, 'figure') for name in CHART_BUILDERS]
+        ],
+        [
+            Input('refresh-interval', 'n_intervals'),
+            Input('region-filter', 'value'),
+            Input('game-filter', 'value')
+        ],
+        State('dashboard-state', 'data')
+    )
+    def refresh_charts(n_intervals, regions, games, state):
+        state = state or {}
+        filters = [sorted(regions or []), sorted(games or [])]
+
+        # Uma consulta barata à versão dos dados decide se é preciso refazer algo; sem banco, vale o último snapshot
+        version = db.fetch_data_version(table_name)
+        snapshot = snapshots.latest() if version is None and snapshots is not None else None
+        if snapshot is not None:
+            version = f"snapshot-{snapshot['id']}"
+        data_changed = version is None or version != state.get('version')
+        if not data_changed and filters == state.get('filters'):
+            raise PreventUpdate
+
+        data = snapshots.read(snapshot) if snapshot is not None else None
+        region_options, game_options = no_update, no_update
+        if data is not None:
+            data = DataCleaner(data).clean_data_graph()
+            generator = ChartGenerator(data, regions=regions, games=games)
+            cache_version = generator.data_version()
+            if data_changed:
+                region_options, game_options = filter_options(data, 'region'), filter_options(data, 'game')
+        else:
+            generator = ChartGenerator(db=db, table_name=table_name, regions=regions, games=games)
+            # Chave do cache montada com a versão lida antes da agregação: se o ETL gravar no meio, as figuras
+            # ficam sob a versão dos dados com que foram feitas (e são refeitas no próximo intervalo)
+            cache_version = generator.data_version(version) if version is not None else None
+            if data_changed:
+                region_options = filter_options(db.fetch_aggregate(table_name, ('region',)), 'region')
+                game_options = filter_options(db.fetch_aggregate(table_name, ('game',)), 'game')
+
+        # Refaz só os gráficos cuja tabela de entrada mudou
+        fingerprints = generator.get_aggregates().fingerprints()
+        previous = state.get('fingerprints', {})
+        changed = [name for name in CHART_BUILDERS if fingerprints[name] != previous.get(name)]
+        charts = generator.generate_charts(changed, cache if cache_version is not None else None, cache_version)
+
+        new_state = {'version': version, 'filters': filters, 'fingerprints': fingerprints}
+        return [
+            new_state, region_options, game_options,
+            *[charts[name] if name in charts else no_update for name in CHART_BUILDERS]
+        ]
+
+
+# Registra o callback dos gráficos de métricas: lê a tabela materializada só quando a versão dela ou os filtros mudam
+def register_metric_callbacks(app, db, metrics_table):
+    @app.callback(
+        [Output('metrics-state', 'data'), *[Output(name, 'figure') for name in METRIC_CHARTS]],
+        [
+            Input('refresh-interval', 'n_intervals'),
+            Input('region-filter', 'value'),
+            Input('game-filter', 'value')
+        ],
+        State('metrics-state', 'data')
+    )
+    def refresh_metric_charts(n_intervals, regions, games, state):
+        state = state or {}
+        filters = [sorted(regions or []), sorted(games or [])]
+
+        # Sem banco (versão None) os gráficos de métricas ficam como estão
+        version = db.fetch_data_version(metrics_table)
+        if version is None or (version == state.get('version') and filters == state.get('filters')):
+            raise PreventUpdate
 
+        metrics = db.fetch_latest_metrics(metrics_table, regions=regions, games=games)
+        charts = MetricsChartGenerator(metrics).generate_charts()
+        return [{'version': version, 'filters': filters}, *[charts[name] for name in METRIC_CHARTS]]
@@ -1,55 +1,434 @@
-from selenium import webdriver
+import logging
+import re
+from datetime import datetime
+from itertools import chain
+
 import pandas as pd
-from prettytable import PrettyTable
+import lxml.html
 from CleaningData import DataCleaner  
+from ScrapeState import hash_rows, hash_table_html
+from Metrics import STAGE_SECONDS, inc, timed_iter, timer
+
+logger = logging.getLogger(__name__)
+
+# selenium, requests e prettytable são importados dentro das funções que os usam,
+# para que quem só lê o banco (dashboard, benchmarks) não pague esse custo na inicialização
+
+# Modos de extração da tabela
+EXTRACT_MODES = ('html', 'webdriver')
+
+# Backends de download da página
+BACKENDS = ('chrome', 'headless', 'http', 'auto')
+
+# Nomes usados no pipeline para as duas colunas de mês mais recentes da tabela (da mais antiga para a mais nova)
+MONTH_COLUMNS = ('Last Month', 'Current Month')
+MONTH_FIELDS = {'Last Month': 'previous_month', 'Current Month': 'current_month'}
+
+# Formatos aceitos nos cabeçalhos de mês do site, ex.: 'Oct 2024' ou 'October 2024'
+MONTH_LABEL_FORMATS = ('%b %Y', '%B %Y')
+
+# Linhas por lote no modo streaming (extração -> limpeza -> upsert)
+CHUNK_SIZE = 50_000
+
+# Marcadores usados para cortar o HTML em trechos com linhas completas
+TABLE_START = re.compile(r'<table\b', re.IGNORECASE)
+TABLE_END = re.compile(r'</table\s*>', re.IGNORECASE)
+ROW_END = re.compile(r'</tr\s*>', re.IGNORECASE)
+
+# Tags que o Selenium renderiza como quebra de linha no .text
+BLOCK_TAGS = {'br', 'div', 'p', 'li', 'tr'}
+
+
+# Aproxima o .text do Selenium: blocos viram quebras de linha e espaços são normalizados
+def element_text(element):
+    for child in element.iterdescendants():
+        if child.tag in BLOCK_TAGS:
+            child.tail = '\n' + (child.tail or '')
+            if child.tag != 'br':
+                child.text = '\n' + (child.text or '')
+    lines = (' '.join(line.split()) for line in ''.join(element.itertext()).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+# Localiza a primeira tabela de um documento (ou fragmento) HTML
+def find_table(html):
+    root = lxml.html.fromstring(html)
+    table = root if root.tag == 'table' else root.find('.//table')
+    if table is None:
+        raise ValueError("Nenhuma tabela encontrada no HTML.")
+    return table
+
+
+# Lê cabeçalhos e linhas de uma tabela HTML localmente, sem chamadas ao WebDriver
+def parse_table_html(html):
+    return parse_table(find_table(html))
+
+
+# Lê cabeçalhos e linhas de um elemento <table> já analisado
+def parse_table(table):
+    headers = [element_text(header) for header in table.iter('th')]
+
+    rows = []
+    for row in list(table.iter('tr'))[1:]:  # Ignora o cabeçalho
+        cells = [element_text(cell).strip() for cell in row.iter('td')]
+        if cells:
+            rows.append(cells)
+    return headers, rows
+
+
+# Lê a primeira tabela de um HTML recebido em pedaços, gerando (cabeçalhos, linhas) em lotes de até chunk_size.
+# O texto é cortado no último </tr> recebido e cada trecho é analisado separadamente, então a memória depende
+# do tamanho do pedaço e do lote, não da tabela (o parser incremental do lxml guarda toda a entrada já lida).
+# Supõe linhas com </tr> explícito, como no site.
+def iter_table_chunks(fragments, chunk_size=CHUNK_SIZE):
+    buffer, headers, rows = '', None, []
+    inside, finished = False, False
+    for fragment in fragments:
+        buffer += fragment
+        if not inside:
+            match = TABLE_START.search(buffer)
+            if match is None:
+                buffer = buffer[-len('<table'):]  # '<table' pode estar dividido entre dois pedaços
+                continue
+            tag_end = buffer.find('>', match.start())
+            if tag_end < 0:
+                buffer = buffer[match.start():]
+                continue
+            buffer, inside = buffer[tag_end + 1:], True
+
+        table_end = TABLE_END.search(buffer)
+        if table_end is not None:
+            batch, finished = buffer[:table_end.start()], True
+        else:
+            row_end = None
+            for row_end in ROW_END.finditer(buffer):
+                pass
+            if row_end is None:
+                continue
+            batch, buffer = buffer[:row_end.end()], buffer[row_end.end():]
+
+        for row in find_table(f'<table>{batch}</table>').iter('tr'):
+            if headers is None:
+                headers = [element_text(header) for header in row.iter('th')]
+                continue
+            cells = [element_text(cell).strip() for cell in row.iter('td')]
+            if cells:
+                rows.append(cells)
+
+        while len(rows) >= chunk_size:
+            yield headers, rows[:chunk_size]
+            rows = rows[chunk_size:]
+        if finished:
+            break
+
+    if headers is None:
+        raise ValueError("Nenhuma tabela encontrada no HTML.")
+    if rows:
+        yield headers, rows
+
+
+# Monta o DataFrame a partir dos cabeçalhos e linhas extraídos
+def build_table_dataframe(headers, rows):
+    headers = list(headers)
+
+    # Corrigir cabeçalhos duplicados
+    unique_headers = []
+    for i, header in enumerate(headers):
+        if header in unique_headers:
+            headers[i] = f"{header}_{i}"
+        unique_headers.append(headers[i])
+
+    # Criando o DataFrame
+    table_data = pd.DataFrame(rows, columns=headers)
+
+    table_data.rename(columns=month_columns(headers), inplace=True)
+    return table_data
+
+
+# Converte um cabeçalho de mês (ex.: 'Oct 2024') em data; None se o cabeçalho não for um mês
+def parse_month_label(label):
+    for label_format in MONTH_LABEL_FORMATS:
+        try:
+            return datetime.strptime(label.strip(), label_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+# Detecta as colunas de mês pelos cabeçalhos (em vez de nomes fixos, que quebram na virada do mês):
+# as duas mais recentes viram Last Month e Current Month, ex.: {'Sep 2024': 'Last Month', 'Oct 2024': 'Current Month'}
+def month_columns(headers):
+    dated = sorted(
+        (month, header) for header, month in ((header, parse_month_label(header)) for header in headers)
+        if month is not None
+    )
+    latest = [header for _, header in dated[-len(MONTH_COLUMNS):]]
+    return dict(zip(latest, MONTH_COLUMNS[-len(latest):])) if latest else {}
+
+
+# Mês de cada coluna de receita a partir dos cabeçalhos, ex.: {'current_month': date(2024, 10, 1)}
+def month_fields(headers):
+    return {
+        MONTH_FIELDS[column]: parse_month_label(header) for header, column in month_columns(headers).items()
+    }
+
+
+# Cria uma sessão HTTP com pool de conexões e novas tentativas
+def build_http_session(pool_size=10, retries=3):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'Mozilla/5.0 (GachaRevenueScraper)'
+    return session
+
+
+# Cria o driver do Chrome; no modo headless, imagens e CSS não são carregados
+def build_chrome_driver(headless=False):
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.managed_default_content_settings.stylesheets': 2
+        })
+        options.page_load_strategy = 'eager'
+    return webdriver.Chrome(options=options)
+
+
 class GachaRevenueScraper:
-    def __init__(self, url):
+    def __init__(self, url, extract_mode='html', backend='chrome', session=None, timeout=30, driver=None,
+                 state_store=None):
+        if extract_mode not in EXTRACT_MODES:
+            raise ValueError(f"Modo de extração inválido: {extract_mode}. Use um de {EXTRACT_MODES}.")
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend inválido: {backend}. Use um de {BACKENDS}.")
         self.url = url
-        self.driver = None
+        self.extract_mode = extract_mode
+        self.backend = backend
+        self.timeout = timeout
+        self.session = session
+        self.owns_session = session is None
+        self.driver = driver
+        self.owns_driver = driver is None
+        self.page_html = None
         self.table_data = None
+        # Mês de cada coluna de receita, ex.: {'current_month': date(2024, 10, 1)}
+        self.months = {}
+        # Coleta incremental: impressão digital da tabela e linhas alteradas
+        self.state_store = state_store
+        self.http_validators = {}
+        self.table_html = None
+        self.fingerprint = None
+        self.unchanged = False
+        self.changed_data = None
 
-    # Inicia o driver do Selenium
+    # Baixa a página pelo backend escolhido (HTTP direto ou Chrome)
     def start_driver(self):
-        self.driver = webdriver.Chrome()
-        self.driver.get(self.url)
+        if self.driver is not None:
+            # Driver já aquecido (ex.: vindo do ScraperPool): só navega
+            with timer(STAGE_SECONDS, stage='page_load', backend='chrome'):
+                self.driver.get(self.url)
+            return
+
+        if self.backend in ('http', 'auto'):
+            import requests
+
+            try:
+                self.fetch_page_http()
+                return
+            except (requests.RequestException, ValueError) as e:
+                if self.backend == 'http':
+                    raise
+                logger.warning("Página não disponível via HTTP (%s), usando Chrome headless...", e)
+
+        self.start_browser()
+
+    # Abre o Chrome (headless, exceto no backend 'chrome') e carrega a página
+    def start_browser(self):
+        with timer(STAGE_SECONDS, stage='driver_startup'):
+            self.driver = build_chrome_driver(headless=self.backend != 'chrome')
+        with timer(STAGE_SECONDS, stage='page_load', backend='chrome'):
+            self.driver.get(self.url)
         self.driver.implicitly_wait(10)
 
+    # Baixa a página renderizada no servidor com uma requisição HTTP simples
+    @timer(STAGE_SECONDS, stage='page_load', backend='http')
+    def fetch_page_http(self):
+        response = self.request_page_http()
+        if response is None:
+            return
+        if '<table' not in response.text.lower():
+            raise ValueError("A página não contém a tabela no HTML do servidor.")
+        self.page_html = response.text
+
+    # Faz o GET condicional da página; retorna None (e marca unchanged) se o servidor responder 304
+    def request_page_http(self, stream=False):
+        if self.session is None:
+            self.session = build_http_session()
+        headers = {}
+        if self.state_store is not None:
+            previous = self.state_store.get(self.url)
+            if previous.get('etag'):
+                headers['If-None-Match'] = previous['etag']
+            if previous.get('last_modified'):
+                headers['If-Modified-Since'] = previous['last_modified']
+
+        response = self.session.get(self.url, timeout=self.timeout, headers=headers, stream=stream)
+        if response.status_code == 304:
+            response.close()
+            self.unchanged = True
+            return None
+        response.raise_for_status()
+        self.http_validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+        if 'charset' not in response.headers.get('Content-Type', ''):
+            response.encoding = 'utf-8'
+        return response
+
+    # Pedaços do HTML baixado por HTTP, sem carregar o corpo inteiro da resposta na memória
+    def iter_page_fragments_http(self, fragment_size=64 * 1024):
+        response = self.request_page_http(stream=True)
+        if response is None:
+            return
+        with response:
+            yield from response.iter_content(chunk_size=fragment_size, decode_unicode=True)
+
     # Extrai os dados da tabela da página
+    @timer(STAGE_SECONDS, stage='extraction')
     def extract_table(self):
-        
+        if self.driver is None and self.page_html is not None:
+            table = find_table(self.page_html)
+            self.table_html = lxml.html.tostring(table, encoding='unicode')
+            headers, rows = parse_table(table)
+        elif self.extract_mode == 'webdriver':
+            headers, rows = self.extract_table_webdriver()
+        else:
+            headers, rows = self.extract_table_html()
+
+        inc('rows_extracted_total', len(rows))
+        self.table_data = build_table_dataframe(headers, rows)
+        self.months = month_fields(headers)
+
+    # Busca o outerHTML da tabela em uma única chamada e analisa localmente
+    def extract_table_html(self):
         table = self.driver.find_element("tag name", "table")
-        headers = [header.text for header in table.find_elements("tag name", "th")]
+        self.table_html = table.get_attribute("outerHTML")
+        return parse_table_html(self.table_html)
 
-        # Corrigir cabeçalhos duplicados
-        unique_headers = []
-        for i, header in enumerate(headers):
-            if header in unique_headers:
-                headers[i] = f"{header}_{i}"
-            unique_headers.append(headers[i])
+    # Lê cada célula pelo WebDriver (uma chamada HTTP por elemento)
+    def extract_table_webdriver(self):
+        table = self.driver.find_element("tag name", "table")
+        self.table_html = table.get_attribute("outerHTML")
+        headers = [header.text for header in table.find_elements("tag name", "th")]
 
         rows = []
         for row in table.find_elements("tag name", "tr")[1:]:  # Ignora o cabeçalho
             cells = [cell.text.strip() for cell in row.find_elements("tag name", "td")]
             if cells:
                 rows.append(cells)
-
-        # Criando o DataFrame
-        self.table_data = pd.DataFrame(rows, columns=headers)
-
-        
-        self.table_data.rename(columns={
-            'Sep 2024': 'Last Month',
-            'Oct 2024': 'Current Month'
-        }, inplace=True)
+        return headers, rows
 
     # Inicia o processo de coleta de dados e limpeza
-    def fetch_data(self):
+    def fetch_data(self, display=True):
         self.start_driver()
+        if self.unchanged:
+            logger.info("Página não modificada desde a última coleta (HTTP 304).")
+            return
+
         self.extract_table()
+        previous = self.state_store.get(self.url) if self.state_store is not None else {}
+        table_hash = hash_table_html(self.table_html)
+        if previous.get('table_hash') == table_hash:
+            logger.info("Tabela idêntica à última coleta; limpeza e gravação ignoradas.")
+            self.unchanged = True
+            return
 
         cleaner = DataCleaner(self.table_data)
         self.table_data = cleaner.clean_data()  
-        self.display_table()
+        self.detect_changes(table_hash)
+        if display:
+            self.display_table()
+
+    # Coleta em modo streaming: gera DataFrames já limpos de até chunk_size linhas, sem montar a tabela inteira.
+    # Pelo HTTP a resposta é lida em pedaços; com o Chrome a página já está toda no navegador e só a análise
+    # e a limpeza são feitas em lotes. Não há hash da tabela nem das linhas (isso exigiria a tabela inteira):
+    # só os validadores HTTP são guardados, então o GET condicional ainda evita coletas repetidas.
+    def iter_data(self, chunk_size=CHUNK_SIZE):
+        chunks = None
+        if self.driver is None and self.backend in ('http', 'auto'):
+            import requests
+
+            # Cada lote é medido na extração: inclui o download do trecho correspondente da resposta
+            chunks = timed_iter(
+                iter_table_chunks(self.iter_page_fragments_http(), chunk_size), STAGE_SECONDS, stage='extraction'
+            )
+            try:
+                first = next(chunks, None)
+            except (requests.RequestException, ValueError) as e:
+                if self.unchanged:
+                    logger.info("Página não modificada desde a última coleta (HTTP 304).")
+                    return
+                if self.backend == 'http':
+                    raise
+                logger.warning("Página não disponível via HTTP (%s), usando Chrome headless...", e)
+                chunks = None
+            else:
+                chunks = chain([first], chunks) if first is not None else iter(())
+
+        if chunks is None:
+            if self.driver is None:
+                self.start_browser()
+            else:
+                with timer(STAGE_SECONDS, stage='page_load', backend='chrome'):
+                    self.driver.get(self.url)
+            table_html = self.driver.find_element("tag name", "table").get_attribute("outerHTML")
+            chunks = timed_iter(iter_table_chunks([table_html], chunk_size), STAGE_SECONDS, stage='extraction')
+
+        for headers, rows in chunks:
+            inc('rows_extracted_total', len(rows))
+            if not self.months:
+                self.months = month_fields(headers)
+            yield DataCleaner(build_table_dataframe(headers, rows)).clean_data()
+        self.fingerprint = dict(self.http_validators)
+
+    # Calcula a impressão digital da coleta e separa as linhas alteradas
+    def detect_changes(self, table_hash):
+        if self.state_store is None:
+            self.changed_data = self.table_data
+            return
+
+        row_hashes = hash_rows(self.table_data)
+        self.changed_data = self.state_store.changed_rows(self.url, self.table_data, row_hashes)
+        self.fingerprint = {
+            **self.http_validators,
+            'table_hash': table_hash,
+            'row_hashes': row_hashes
+        }
+        logger.info("Linhas alteradas desde a última coleta: %d de %d", len(self.changed_data), len(self.table_data),
+                    extra={'rows': len(self.changed_data)})
+
+    # Linhas que precisam ser gravadas no banco (todas, se não houver estado salvo)
+    def get_changed_data(self):
+        return self.changed_data
+
+    # Persiste a impressão digital; chame só depois que o banco foi atualizado
+    def commit_state(self):
+        if self.state_store is not None and self.fingerprint is not None:
+            self.state_store.save(self.url, self.fingerprint)
 
     
     def get_data(self):
@@ -57,6 +436,8 @@ class GachaRevenueScraper:
 
     # Exibe a tabela de maneira estilizada com PrettyTable."""
     def display_table(self):
+        from prettytable import PrettyTable
+
         pretty_table = PrettyTable()
         pretty_table.field_names = self.table_data.columns
 
@@ -65,6 +446,11 @@ class GachaRevenueScraper:
 
         print(pretty_table)
 
-    # Fecha o driver do Selenium
+    # Fecha o driver do Selenium e a sessão HTTP
     def close_driver(self):
-        self.driver.quit()
+        if self.driver and self.owns_driver:
+            self.driver.quit()
+        self.driver = None
+        if self.session is not None and self.owns_session:
+            self.session.close()
+            self.session = None
@@ -1,13 +1,122 @@
+import hashlib
+import logging
+
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import plotly.graph_objects as go  # já carregado pelo Dash; plotly.express é importado só ao montar o gráfico
 from CleaningData import DataCleaner
+from ChartCache import frame_version
+from Metrics import CHART_SECONDS, set_gauge, timer
+
+logger = logging.getLogger(__name__)
+
+
+class ChartAggregates:
+    # Tabelas derivadas usadas pelos gráficos, todas calculadas a partir de uma única agregação game x region
+    def __init__(self, game_region, regions=None, games=None):
+        if regions:
+            game_region = game_region[game_region['region'].isin(regions)]
+        if games:
+            game_region = game_region[game_region['game'].isin(games)]
+        self.game_region = game_region.sort_values(['game', 'region']).reset_index(drop=True)
+
+        # Contagem de jogos e receitas por região
+        by_region = self.game_region.groupby('region', observed=True, sort=True)
+        self.region_counts = by_region['count'].sum().reset_index()
+        self.region_totals = by_region[['current_month', 'previous_month']].sum().reset_index()
+        self.region_totals['total_revenue'] = (
+            self.region_totals['current_month'] + self.region_totals['previous_month']
+        )
+
+        # Receita por jogo, em ordem crescente do mês atual
+        self.game_revenue = self.game_region.groupby('game', observed=True, sort=True)[
+            ['current_month', 'previous_month']
+        ].sum().reset_index().sort_values('current_month', ascending=True)
+
+        # Totais de cada mês
+        self.month_totals = {
+            'previous_month': self.game_region['previous_month'].sum(),
+            'current_month': self.game_region['current_month'].sum()
+        }
+
+    # Impressão digital da tabela de entrada de cada gráfico, para saber quais mudaram
+    def fingerprints(self):
+        return {
+            name: frame_version(pd.DataFrame([table]) if isinstance(table, dict) else table)
+            for name, table in ((name, getattr(self, attribute)) for name, attribute in CHART_INPUTS.items())
+        }
+
+    # Limpa os textos uma vez e agrega o DataFrame em uma única passada
+    @classmethod
+    @timer(CHART_SECONDS, chart='aggregates', source='frame')
+    def from_frame(cls, data, regions=None, games=None):
+        game_region = data.groupby(['game', 'region'], observed=True, sort=False, dropna=False).agg(
+            count=('current_month', 'size'),
+            current_month=('current_month', 'sum'),
+            previous_month=('previous_month', 'sum')
+        ).reset_index()
+        return cls(game_region, regions, games)
+
+    # Agrega no banco (uma consulta game x region) e deriva o resto localmente
+    @classmethod
+    @timer(CHART_SECONDS, chart='aggregates', source='database')
+    def from_database(cls, db, table_name, regions=None, games=None):
+        game_region = db.fetch_aggregate(table_name, ('game', 'region'), regions=regions, games=games)
+        if game_region.empty:
+            game_region = pd.DataFrame(columns=['game', 'region', 'count', 'current_month', 'previous_month'])
+        return cls(game_region, regions, games)
+
+
+# Nome de cada gráfico e o método que o gera
+CHART_BUILDERS = {
+    "server_distribution_pie_chart": 'generate_server_distribution_pie_chart',
+    "revenue_distribution_pie_chart": 'generate_revenue_distribution_pie_chart',
+    "monthly_revenue_bar_chart": 'generate_monthly_revenue_bar_chart',
+    "monthly_revenue_comparison_bar_chart": 'generate_monthly_revenue_comparison_bar_chart',
+    "revenue_trend_line_chart": 'generate_revenue_heatmap',
+    "grouped_bar_chart": 'generate_grouped_bar_chart',
+}
+
+# Orçamento de renderização: jogos exibidos por gráfico, limite para trocar por WebGL e tamanho máximo da figura.
+# Com o padrão, os gráficos por jogo mostram os 25 maiores e "Other"; top_n=None volta a mostrar todos os jogos.
+TOP_N_GAMES = 25
+WEBGL_THRESHOLD = 1000
+MAX_FIGURE_BYTES = 1_000_000
+MIN_TOP_N_GAMES = 5
+OTHER_LABEL = "Other"
+
+# Gráficos com um item por jogo (sujeitos ao top-N)
+GAME_CHARTS = {"monthly_revenue_bar_chart", "revenue_trend_line_chart", "grouped_bar_chart"}
+
+# Tabela de ChartAggregates consumida por cada gráfico
+CHART_INPUTS = {
+    "server_distribution_pie_chart": 'region_counts',
+    "revenue_distribution_pie_chart": 'region_totals',
+    "monthly_revenue_bar_chart": 'game_revenue',
+    "monthly_revenue_comparison_bar_chart": 'month_totals',
+    "revenue_trend_line_chart": 'game_revenue',
+    "grouped_bar_chart": 'game_region',
+}
 
 
 class ChartGenerator:
-    def __init__(self, data):
+    # Usa um DataFrame já carregado ou, com db, agrega direto no banco
+    def __init__(self, data=None, db=None, table_name='gacha_revenue', regions=None, games=None,
+                 top_n=TOP_N_GAMES, webgl_threshold=WEBGL_THRESHOLD, max_figure_bytes=MAX_FIGURE_BYTES):
+        if data is None and db is None:
+            raise ValueError("Informe um DataFrame ou um banco de dados para gerar os gráficos.")
         self.data = data
-        self.cleaner = DataCleaner(data)
+        self.db = db
+        self.table_name = table_name
+        # Filtros opcionais de região e jogo (nomes já limpos)
+        self.regions = sorted(regions) if regions else None
+        self.games = sorted(games) if games else None
+        # Orçamento de renderização (top_n=None desativa o agrupamento em "Other")
+        self.top_n = top_n
+        self.webgl_threshold = webgl_threshold
+        self.max_figure_bytes = max_figure_bytes
+        self.payload_sizes = {}
+        self.cleaner = DataCleaner(data) if data is not None else None
+        self.aggregates = None
 
     # Validar colunas necessárias
     def validate_columns(self, *required_columns):
@@ -17,26 +126,63 @@ class ChartGenerator:
 
     # Limpar dados usando o módulo de limpeza
     def clean_data_graph(self):
-        self.data = self.cleaner.clean_data_graph()
+        if self.db is None:
+            self.data = self.cleaner.clean_data_graph()
+
+    # Tabelas agregadas compartilhadas pelos gráficos (limpeza e agregação feitas uma única vez)
+    def get_aggregates(self):
+        if self.aggregates is None:
+            if self.db is not None:
+                self.aggregates = ChartAggregates.from_database(self.db, self.table_name, self.regions, self.games)
+            else:
+                self.validate_columns('region', 'game', 'current_month', 'previous_month')
+                self.clean_data_graph()
+                self.aggregates = ChartAggregates.from_frame(self.data, self.regions, self.games)
+        return self.aggregates
+
+    # Mantém os top_n jogos de maior receita e soma os demais em "Other"
+    def limit_games(self, table, keys=('game',), top_n=None):
+        top_n = top_n or self.top_n
+        if top_n is None or table['game'].nunique() <= top_n:
+            return table
+
+        totals = table.groupby('game', observed=True)['current_month'].sum()
+        keep = totals.nlargest(top_n).index
+        game = table['game'].astype(object).where(table['game'].isin(keep), OTHER_LABEL)
+        numeric_columns = [column for column in table.select_dtypes('number').columns if column not in keys]
+        return table.assign(game=game).groupby(list(keys), sort=False, observed=True)[
+            numeric_columns
+        ].sum().reset_index()
 
     # Gráfico de barras de receita mensal com cores únicas por jogo
-    def generate_monthly_revenue_bar_chart(self):
-        try:
-            self.validate_columns('game', 'current_month')
-            self.clean_data_graph()
+    def generate_monthly_revenue_bar_chart(self, top_n=None):
+        import plotly.express as px
 
-            self.data = self.data.dropna(subset=['game', 'current_month'])
-            self.data = self.data.sort_values('current_month', ascending=True)
+        try:
+            game_data = self.get_aggregates().game_revenue.dropna(subset=['game', 'current_month'])
+            game_data = self.limit_games(game_data, top_n=top_n).sort_values('current_month', ascending=True)
 
-            fig = px.bar(
-                self.data,
-                x="game",
-                y="current_month",
-                title="Monthly Revenue by Game",
-                labels={"current_month": "Revenue ($)", "game": "Game"},
-                color="game",
-                color_discrete_sequence=px.colors.qualitative.Set2
-            )
+            # Decide pelas linhas que serão plotadas: com o top-N a figura já é pequena e continua em barras;
+            # o WebGL só entra com top_n=None (ou muito grande) e mais jogos que o limite
+            if self.webgl_threshold is not None and len(game_data) > self.webgl_threshold:
+                # Muitos jogos: um único trace WebGL em vez de um trace de barras por jogo
+                fig = go.Figure(go.Scattergl(
+                    x=game_data['game'].astype(str),
+                    y=game_data['current_month'],
+                    mode='markers',
+                    marker=dict(color=px.colors.qualitative.Set2[0])
+                ))
+                fig.update_layout(title="Monthly Revenue by Game")
+            else:
+                fig = px.bar(
+                    game_data,
+                    x="game",
+                    y="current_month",
+                    title="Monthly Revenue by Game",
+                    labels={"current_month": "Revenue ($)", "game": "Game"},
+                    color="game",
+                    color_discrete_sequence=px.colors.qualitative.Set2
+                )
             fig.update_layout(
                 xaxis=dict(title="Game", tickangle=45),
                 yaxis=dict(title="Revenue ($)", tickformat="$,.0f"),
@@ -45,16 +191,14 @@ class ChartGenerator:
             return fig
 
         except Exception as e:
-            print(f"Error generating monthly revenue bar chart: {e}")
+            logger.error("Error generating monthly revenue bar chart: %s", e)
 
     # Gráfico de pizza para distribuição por região de servidor
     def generate_server_distribution_pie_chart(self):
-        try:
-            self.validate_columns('region')
-            self.clean_data_graph()
+        import plotly.express as px
 
-            region_counts = self.data['region'].value_counts().reset_index()
-            region_counts.columns = ['region', 'count']
+        try:
+            region_counts = self.get_aggregates().region_counts
 
             fig = px.pie(
                 region_counts,
@@ -67,16 +211,14 @@ class ChartGenerator:
             return fig
 
         except Exception as e:
-            print(f"Error generating server distribution pie chart: {e}")
+            logger.error("Error generating server distribution pie chart: %s", e)
 
     # Gráfico de barras comparando receita entre o mês atual e o anterior
     def generate_monthly_revenue_comparison_bar_chart(self):
         try:
-            self.validate_columns('game', 'current_month', 'previous_month')
-            self.clean_data_graph()
-
-            total_revenue_current = self.data['current_month'].sum()
-            total_revenue_previous = self.data['previous_month'].sum()
+            totals = self.get_aggregates().month_totals
+            total_revenue_current = totals['current_month']
+            total_revenue_previous = totals['previous_month']
 
             fig = go.Figure()
             fig.add_trace(go.Bar(
@@ -95,45 +237,41 @@ class ChartGenerator:
             return fig
 
         except Exception as e:
-            print(f"Error generating monthly revenue comparison bar chart: {e}")
+            logger.error("Error generating monthly revenue comparison bar chart: %s", e)
 
-    # Heatmap comparando receitas de jogos
-    def generate_revenue_heatmap(self):
+    # Heatmap comparando receitas de jogos (matriz mês x jogo já agregada, sem binning no navegador)
+    def generate_revenue_heatmap(self, top_n=None):
         try:
-            self.validate_columns('game', 'current_month', 'previous_month')
-            self.clean_data_graph()
-
-            heatmap_data = self.data[['game', 'current_month', 'previous_month']]
-            heatmap_data = heatmap_data.melt(id_vars='game', var_name='month', value_name='revenue')
-
-            fig = px.density_heatmap(
-                heatmap_data,
-                x='game',
-                y='month',
-                z='revenue',
-                color_continuous_scale='Viridis',
-                title="Heatmap: Revenue Comparison",
-                labels={"game": "Game", "month": "Month", "revenue": "Revenue ($)"}
-            )
+            heatmap_data = self.get_aggregates().game_revenue[['game', 'current_month', 'previous_month']]
+            heatmap_data = self.limit_games(heatmap_data, top_n=top_n)
+
+            fig = go.Figure(go.Heatmap(
+                x=heatmap_data['game'].astype(str),
+                y=['current_month', 'previous_month'],
+                z=[heatmap_data['current_month'].tolist(), heatmap_data['previous_month'].tolist()],
+                colorscale='Viridis',
+                colorbar=dict(title="Revenue ($)"),
+                hovertemplate="Game: %{x}<br>Month: %{y}<br>Revenue ($): %{z:$,.0f}<extra></extra>"
+            ))
             fig.update_layout(
-                xaxis=dict(tickangle=45),
+                title="Heatmap: Revenue Comparison",
+                xaxis=dict(title="Game", tickangle=45),
                 yaxis=dict(title="Month"),
                 title_x=0.5
             )
             return fig
         except Exception as e:
-            print(f"Error generating revenue heatmap: {e}")
+            logger.error("Error generating revenue heatmap: %s", e)
 
     # Gráfico de dispersão de receita por região de servidor
     # Gráfico de barras agrupadas para comparação de lucro por região e jogo
-    def generate_grouped_bar_chart(self):
-        try:
-            # Validar as colunas necessárias
-            self.validate_columns('game', 'region', 'current_month')
-            self.clean_data_graph()
+    def generate_grouped_bar_chart(self, top_n=None):
+        import plotly.express as px
 
-            # Agrupar os dados para facilitar o gráfico
-            grouped_data = self.data.groupby(['game', 'region'])['current_month'].sum().reset_index()
+        try:
+            # Dados já agrupados por jogo e região
+            grouped_data = self.get_aggregates().game_region[['game', 'region', 'current_month']]
+            grouped_data = self.limit_games(grouped_data, keys=('game', 'region'), top_n=top_n)
 
             # Criar o gráfico de barras agrupadas
             fig = px.bar(
@@ -156,17 +294,15 @@ class ChartGenerator:
             return fig
 
         except Exception as e:
-            print(f"Error generating grouped bar chart: {e}")
+            logger.error("Error generating grouped bar chart: %s", e)
 
 
     # Gráfico de pizza para distribuição de receita por servidor
     def generate_revenue_distribution_pie_chart(self):
-        try:
-            self.validate_columns('region', 'current_month', 'previous_month')
-            self.clean_data_graph()
+        import plotly.express as px
 
-            region_data = self.data.groupby('region')[['current_month', 'previous_month']].sum().sum(axis=1).reset_index()
-            region_data.columns = ['region', 'total_revenue']
+        try:
+            region_data = self.get_aggregates().region_totals
 
             fig = px.pie(
                 region_data,
@@ -179,21 +315,154 @@ class ChartGenerator:
             return fig
 
         except Exception as e:
-            print(f"Error generating revenue distribution pie chart: {e}")
+            logger.error("Error generating revenue distribution pie chart: %s", e)
+
+    # Versão dos dados usada como chave do cache (versão da tabela no banco ou hash do DataFrame, mais os filtros).
+    # table_version evita uma nova consulta quando a versão da tabela já foi lida antes da agregação.
+    def data_version(self, table_version=None):
+        if self.db is not None:
+            version = self.db.fetch_data_version(self.table_name) if table_version is None else table_version
+            if version is None:
+                return None
+            version = f"db-{self.table_name}-{version}"
+        else:
+            version = frame_version(self.data)
+
+        if self.regions or self.games:
+            filters = repr((self.regions, self.games)).encode('utf-8')
+            version = f"{version}-f{hashlib.sha256(filters).hexdigest()[:8]}"
+        return f"{version}-n{self.top_n}"
+
+    # Gera um gráfico, medindo a duração da montagem
+    def build_chart(self, name):
+        with timer(CHART_SECONDS, chart=name):
+            return self.build_chart_within_budget(name)
+
+    # Gera um gráfico respeitando o orçamento de bytes: reduz o top-N até caber (gráficos por jogo)
+    def build_chart_within_budget(self, name):
+        builder = getattr(self, CHART_BUILDERS[name])
+        fig = builder()
+        if fig is None:
+            return None
+
+        size = len(fig.to_json().encode('utf-8'))
+        top_n = self.top_n
+        while (self.max_figure_bytes is not None and size > self.max_figure_bytes and name in GAME_CHARTS
+               and top_n is not None and top_n > MIN_TOP_N_GAMES):
+            top_n = max(MIN_TOP_N_GAMES, top_n // 2)
+            smaller = builder(top_n=top_n)
+            # Se a nova tentativa falhar, fica a última figura válida (mesmo acima do orçamento)
+            if smaller is None:
+                break
+            fig = smaller
+            size = len(fig.to_json().encode('utf-8'))
+
+        self.payload_sizes[name] = size
+        set_gauge('chart_payload_bytes', size, chart=name)
+        if self.max_figure_bytes is not None and size > self.max_figure_bytes:
+            logger.warning("Aviso: figura '%s' com %s bytes excede o orçamento de %s bytes",
+                           name, f"{size:,}", f"{self.max_figure_bytes:,}")
+        return fig
 
-    # Gerar todos os gráficos
-    def generate_all_charts(self):
+    # Gera apenas os gráficos informados (reaproveitando o cache de figuras, se houver)
+    def generate_charts(self, names, cache=None, version=None):
+        if cache is not None and version is None:
+            version = self.data_version()
+        charts = {}
+        for name in names:
+            fig = cache.get(version, name) if cache is not None and version is not None else None
+            if fig is None:
+                fig = self.build_chart(name)
+                if cache is not None and version is not None:
+                    cache.put(version, name, fig)
+            charts[name] = fig
+        return charts
+
+    # Gerar todos os gráficos (reaproveitando o cache de figuras, se informado)
+    def generate_all_charts(self, cache=None):
         try:
-            self.clean_data_graph()
-            charts = {
-                "server_distribution_pie_chart": self.generate_server_distribution_pie_chart(),
-                "revenue_distribution_pie_chart": self.generate_revenue_distribution_pie_chart(),
-                "monthly_revenue_bar_chart": self.generate_monthly_revenue_bar_chart(),
-                "monthly_revenue_comparison_bar_chart": self.generate_monthly_revenue_comparison_bar_chart(),
-                "revenue_trend_line_chart": self.generate_revenue_heatmap(),
-                "grouped_bar_chart": self.generate_grouped_bar_chart(),
-            }
-            print("All charts generated successfully!")
+            charts = self.generate_charts(CHART_BUILDERS, cache)
+            logger.info("All charts generated successfully!")
+            if self.payload_sizes:
+                logger.info("Tamanho das figuras (bytes): %s", ", ".join(
+                    f"{name}={size:,}" for name, size in self.payload_sizes.items()
+                ), extra={'payload_bytes': dict(self.payload_sizes)})
             return charts
         except Exception as e:
-            print(f"Error generating all charts: {e}")
+            logger.error("Error generating all charts: %s", e)
+
+
+# Gráficos lidos direto da tabela de métricas materializadas (nada é derivado por requisição)
+METRIC_CHARTS = {
+    "growth_leaders_chart": 'generate_growth_leaders_chart',
+    "region_share_chart": 'generate_region_share_chart',
+}
+
+
+class MetricsChartGenerator:
+    # Recebe as métricas do mês mais recente (uma linha por region x game), ex.: db.fetch_latest_metrics()
+    def __init__(self, metrics, top_n=TOP_N_GAMES):
+        self.metrics = metrics
+        self.top_n = top_n
+
+    # Jogos com maior crescimento em relação ao mês anterior, com a variação no ranking da região
+    def generate_growth_leaders_chart(self):
+        try:
+            leaders = self.metrics.dropna(subset=['mom_growth']).nlargest(self.top_n, 'mom_growth')
+            leaders = leaders.sort_values('mom_growth', ascending=True)
+            labels = leaders['game'].astype(str) + ' (' + leaders['region'].astype(str) + ')'
+
+            fig = go.Figure(go.Bar(
+                x=leaders['mom_growth'],
+                y=labels,
+                orientation='h',
+                marker_color='#90EE90',
+                customdata=leaders[['revenue', 'rank', 'rank_change']].astype('float64').to_numpy(),
+                hovertemplate=(
+                    "%{y}<br>Growth: %{x:+.1%}<br>Revenue ($): %{customdata[0]:$,.0f}"
+                    "<br>Rank: %{customdata[1]:.0f} (%{customdata[2]:+.0f})<extra></extra>"
+                )
+            ))
+            fig.update_layout(
+                title="Month-over-Month Growth Leaders",
+                xaxis=dict(title="Growth", tickformat="+.0%"),
+                yaxis=dict(title="Game"),
+                title_x=0.5
+            )
+            return fig
+        except Exception as e:
+            logger.error("Error generating growth leaders chart: %s", e)
+
+    # Participação dos maiores jogos na receita de cada região (o resto somado em "Other")
+    def generate_region_share_chart(self):
+        import plotly.express as px
+
+        try:
+            shares = self.metrics.dropna(subset=['region_share'])
+            keep = shares.groupby('game')['revenue'].sum().nlargest(self.top_n).index
+            game = shares['game'].where(shares['game'].isin(keep), OTHER_LABEL)
+            shares = shares.assign(game=game).groupby(['region', 'game'], sort=False)[
+                'region_share'
+            ].sum().reset_index()
+
+            fig = px.bar(
+                shares,
+                x="region",
+                y="region_share",
+                color="game",
+                title="Revenue Share by Region",
+                labels={"region_share": "Share", "region": "Region", "game": "Game"},
+                color_discrete_sequence=px.colors.qualitative.Set3
+            )
+            fig.update_layout(yaxis=dict(tickformat=".0%"), barmode="stack", title=dict(x=0.5))
+            return fig
+        except Exception as e:
+            logger.error("Error generating region share chart: %s", e)
+
+    # Gera os gráficos informados, medindo a duração de cada um
+    def generate_charts(self, names=METRIC_CHARTS):
+        charts = {}
+        for name in names:
+            with timer(CHART_SECONDS, chart=name):
+                charts[name] = getattr(self, METRIC_CHARTS[name])()
+        return charts
@@ -0,0 +1,224 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('metrics')
+
+# Nomes das métricas de duração (histogramas, em segundos)
+STAGE_SECONDS = 'scrape_stage_seconds'
+DB_SECONDS = 'db_operation_seconds'
+CHART_SECONDS = 'chart_build_seconds'
+RENDER_SECONDS = 'dashboard_render_seconds'
+ETL_SECONDS = 'etl_run_seconds'
+ANALYTICS_SECONDS = 'analytics_seconds'
+
+# Texto de ajuda de cada métrica exposta em /metrics
+METRIC_HELP = {
+    STAGE_SECONDS: "Duração das etapas da coleta (driver_startup, page_load, extraction, cleaning).",
+    DB_SECONDS: "Duração de cada operação no banco de dados.",
+    CHART_SECONDS: "Duração da montagem de cada gráfico.",
+    RENDER_SECONDS: "Duração da renderização do layout e dos callbacks do dashboard.",
+    ETL_SECONDS: "Duração de cada execução completa do ETL.",
+    ANALYTICS_SECONDS: "Duração do cálculo das métricas de receita (completo ou incremental).",
+    'rows_extracted_total': "Linhas extraídas da tabela do site.",
+    'rows_cleaned_total': "Linhas processadas pelo DataCleaner.",
+    'rows_upserted_total': "Linhas enviadas ao upsert da tabela atual.",
+    'snapshot_rows_total': "Linhas gravadas no histórico.",
+    'chart_cache_requests_total': "Consultas ao cache de figuras, por resultado.",
+    'chart_payload_bytes': "Tamanho serializado da última figura de cada gráfico.",
+    'etl_runs_total': "Execuções do ETL, por resultado.",
+    'backfill_months_total': "Meses processados pelo backfill, por resultado (ok, unavailable, error).",
+    'backfill_months_per_minute': "Vazão do último backfill, em meses por minuto.",
+}
+
+# Limites (em segundos) dos buckets dos histogramas de duração
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Atributos padrão de um LogRecord; o resto veio de extra= e vira campo do JSON
+RESERVED_LOG_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+# Rótulos como tupla ordenada, usada como chave das séries
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+# Rótulos no formato {name="value",...}, com os escapes do formato texto do Prometheus
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class MetricsRegistry:
+    # Contadores, gauges e histogramas em memória, com exportação no formato texto do Prometheus
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, label_key(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    # Cópia simples dos valores, ex.: {'db_operation_seconds': {(('operation', 'upsert'),): {...}}}
+    def snapshot(self):
+        with self.lock:
+            values = {}
+            for store in (self.counters, self.gauges, self.histograms):
+                for (name, key), value in store.items():
+                    values.setdefault(name, {})[key] = dict(value) if isinstance(value, dict) else value
+            return values
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    # Formato de exposição em texto do Prometheus (version=0.0.4)
+    def render(self):
+        with self.lock:
+            lines = []
+            for kind, store in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in store}):
+                    lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (metric, key), value in sorted(store.items()):
+                        if metric == name:
+                            lines.append(f"{name}{format_labels(key)} {value}")
+
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, key), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(self.buckets, histogram['buckets']):
+                        lines.append(f"{name}_bucket{format_labels(key, [('le', str(bound))])} {count}")
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{name}_sum{format_labels(key)} {histogram['sum']:.6f}")
+                    lines.append(f"{name}_count{format_labels(key)} {histogram['count']}")
+            return '\n'.join(lines) + '\n'
+
+
+# Registro único do processo, lido por /metrics
+REGISTRY = MetricsRegistry()
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    REGISTRY.set(name, value, **labels)
+
+
+# Registra uma duração no histograma e em uma linha de log estruturada
+def record(name, seconds, status='ok', **labels):
+    REGISTRY.observe(name, seconds, **labels)
+    logger.info("%s %s %.4fs", name, ' '.join(f"{k}={v}" for k, v in labels.items()), seconds,
+                extra={'metric': name, 'labels': labels, 'seconds': round(seconds, 6), 'status': status})
+
+
+# Mede um bloco (ou, como decorador, uma função) e registra a duração com os rótulos informados
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        record(name, time.perf_counter() - start, status, **labels)
+
+
+# Mede o tempo de produção de cada item de um iterador (ex.: cada lote lido no modo streaming)
+def timed_iter(iterable, name, **labels):
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record(name, time.perf_counter() - start, **labels)
+        yield item
+
+
+class JsonFormatter(logging.Formatter):
+    # Uma linha JSON por registro, incluindo os campos passados em extra= (metric, labels, seconds, rows...)
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in RESERVED_LOG_FIELDS})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Configura o log do processo: JSON estruturado (padrão) ou texto simples
+def configure_logging(level='INFO', structured=True):
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        JsonFormatter() if structured else logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+    )
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+# Serve /metrics em uma thread à parte (para processos sem servidor web, como o ETL)
+def serve_metrics(port, host='0.0.0.0', registry=REGISTRY):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
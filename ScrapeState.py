@@ -0,0 +1,81 @@
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Colunas que identificam uma linha e colunas gravadas no banco
+KEY_COLUMNS = ['region', 'game']
+VALUE_COLUMNS = ['current_month', 'previous_month']
+
+
+# Hash do HTML bruto da tabela
+def hash_table_html(html):
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    return hashlib.sha256(html).hexdigest()
+
+
+# Chave (region, game) de cada linha
+def row_keys(data):
+    return data['region'].astype(str) + '\x1f' + data['game'].astype(str)
+
+
+# Linhas cuja chave (region, game) aparece de novo mais adiante; como no upsert, vale a última ocorrência
+def duplicated_keys(data):
+    return row_keys(data).duplicated(keep='last')
+
+
+# Hash de cada linha limpa, indexado por (region, game) (só a última ocorrência de chaves repetidas)
+def hash_rows(data):
+    columns = KEY_COLUMNS + VALUE_COLUMNS
+    latest = ~duplicated_keys(data)
+    hashes = pd.util.hash_pandas_object(data.loc[latest, columns].astype(str), index=False)
+    return dict(zip(row_keys(data)[latest], hashes.astype(str)))
+
+
+class ScrapeStateStore:
+    # Guarda, por URL, a impressão digital da última tabela gravada no banco
+    def __init__(self, path='scrape_state.json'):
+        self.path = path
+        self.state = self.load()
+
+    # Carrega o estado salvo (ou vazio se ainda não existir)
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Estado de coleta ilegível, ignorando (%s)", e)
+            return {}
+
+    def get(self, url):
+        return self.state.get(url, {})
+
+    # Salva a impressão digital de uma URL de forma atômica
+    def save(self, url, entry):
+        self.state[url] = entry
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    # Retorna uma cópia só com as linhas novas ou alteradas em relação à última coleta.
+    # Chaves (region, game) repetidas ficam só com a última ocorrência, a mesma que o upsert gravaria.
+    def changed_rows(self, url, data, row_hashes):
+        duplicated = duplicated_keys(data)
+        if duplicated.any():
+            logger.warning("%d linhas com (region, game) repetido descartadas; vale a última ocorrência.",
+                           duplicated.sum())
+            data = data[~duplicated]
+
+        previous = self.get(url).get('row_hashes', {})
+        if not previous:
+            return data.copy()
+        changed = [previous.get(key) != row_hashes[key] for key in row_keys(data)]
+        return data[changed].copy()
@@ -0,0 +1,110 @@
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+from selenium.common.exceptions import WebDriverException
+
+from GameScraping import GachaRevenueScraper, build_chrome_driver
+
+logger = logging.getLogger(__name__)
+
+
+# Driver mantido aquecido no pool, com a contagem de páginas já carregadas
+class PooledDriver:
+    def __init__(self):
+        self.driver = None
+        self.pages = 0
+
+    # Cria o driver sob demanda (na primeira vez ou depois de reciclado)
+    def acquire(self, headless):
+        if self.driver is None:
+            self.driver = build_chrome_driver(headless=headless)
+            self.driver.implicitly_wait(10)
+        return self.driver
+
+    # Descarta o driver atual; o próximo uso cria um novo
+    def recycle(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                pass
+        self.driver = None
+        self.pages = 0
+
+
+class ScraperPool:
+    # Mantém N drivers aquecidos e distribui as URLs entre eles por um pool de threads
+    def __init__(self, size=4, max_pages_per_driver=50, headless=True, extract_mode='html', retries=1):
+        if size < 1:
+            raise ValueError("O pool precisa de pelo menos um driver.")
+        self.size = size
+        self.max_pages_per_driver = max_pages_per_driver
+        self.headless = headless
+        self.extract_mode = extract_mode
+        self.retries = retries
+        self.drivers = queue.Queue()
+        self.slots = []
+        self.executor = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Inicia os drivers em paralelo para que o custo de abertura seja pago uma única vez
+    def start(self):
+        self.slots = [PooledDriver() for _ in range(self.size)]
+        with ThreadPoolExecutor(max_workers=self.size) as warmup:
+            list(warmup.map(lambda slot: slot.acquire(self.headless), self.slots))
+        for slot in self.slots:
+            self.drivers.put(slot)
+        self.executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='scraper')
+
+    # Raspa e limpa uma página usando um driver do pool
+    def scrape_page(self, url):
+        slot = self.drivers.get()
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    scraper = GachaRevenueScraper(url, extract_mode=self.extract_mode,
+                                                  driver=slot.acquire(self.headless))
+                    scraper.fetch_data(display=False)
+                    slot.pages += 1
+                    return scraper.get_data()
+                except WebDriverException:
+                    # Driver travou ou caiu: recicla e tenta de novo com um driver novo
+                    slot.recycle()
+                    if attempt == self.retries:
+                        raise
+        finally:
+            if slot.pages >= self.max_pages_per_driver:
+                slot.recycle()
+            self.drivers.put(slot)
+
+    # Raspa várias URLs e devolve (url, DataFrame) conforme cada página termina
+    def scrape(self, urls):
+        if self.executor is None:
+            self.start()
+
+        futures = {self.executor.submit(self.scrape_page, url): url for url in urls}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                yield url, future.result()
+            except Exception as e:
+                logger.error("Erro ao raspar %s: %s", url, e)
+                yield url, pd.DataFrame()
+
+    # Encerra as threads e fecha todos os drivers
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        for slot in self.slots:
+            slot.recycle()
+        self.slots = []
+        self.drivers = queue.Queue()
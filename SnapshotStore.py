@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+# Diretório padrão dos snapshots (variável de ambiente SNAPSHOT_DIR, compartilhada pelo ETL e pelo dashboard,
+# inclusive sob um servidor WSGI), nome do manifesto e quantos snapshots manter
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshots')
+MANIFEST_FILE = 'manifest.json'
+KEEP_SNAPSHOTS = 48
+
+# Colunas gravadas em cada snapshot (as mesmas do upsert)
+SNAPSHOT_COLUMNS = ['region', 'game', 'current_month', 'previous_month']
+CATEGORY_COLUMNS = ['region', 'game']
+
+
+# Converte um DataFrame limpo em tabela Arrow com tipos estáveis entre coletas e entre lotes
+def snapshot_table(data):
+    import pyarrow as pa
+
+    frame = data[SNAPSHOT_COLUMNS].astype({
+        'region': str, 'game': str, 'current_month': 'float64', 'previous_month': 'float64'
+    })
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+class SnapshotWriter:
+    # Grava um snapshot em partes (um row group por lote); o arquivo só entra no manifesto em commit()
+    def __init__(self, store, url=None, months=None, scraped_at=None):
+        self.store = store
+        self.url = url
+        self.months = months or {}
+        self.scraped_at = scraped_at or datetime.now(timezone.utc)
+        self.snapshot_id = f"{self.scraped_at:%Y%m%dT%H%M%SZ}-{uuid4().hex[:8]}"
+        self.path = os.path.join(store.directory, f"{self.snapshot_id}.parquet")
+        self.tmp_path = f"{self.path}.tmp"
+        self.writer = None
+        self.rows = 0
+
+    def write(self, data):
+        import pyarrow.parquet as pq
+
+        table = snapshot_table(data)
+        if self.writer is None:
+            os.makedirs(self.store.directory, exist_ok=True)
+            self.writer = pq.ParquetWriter(self.tmp_path, table.schema)
+        self.writer.write_table(table)
+        self.rows += len(data)
+
+    # Fecha o arquivo e o registra no manifesto; retorna a entrada (ou None se nada foi gravado)
+    def commit(self):
+        if self.writer is None:
+            return None
+        self.writer.close()
+        self.writer = None
+        os.replace(self.tmp_path, self.path)
+        entry = {
+            'id': self.snapshot_id,
+            'file': os.path.basename(self.path),
+            'url': self.url,
+            'rows': self.rows,
+            'scraped_at': self.scraped_at.isoformat(),
+            'months': {column: month.isoformat() for column, month in self.months.items()}
+        }
+        self.store.add(entry)
+        return entry
+
+    # Descarta um snapshot incompleto (ex.: a coleta falhou no meio)
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
+
+
+class SnapshotStore:
+    # Snapshots locais em Parquet de cada coleta limpa, listados do mais antigo ao mais novo em um manifesto
+    def __init__(self, directory=SNAPSHOT_DIR, keep=KEEP_SNAPSHOTS):
+        self.directory = directory
+        self.keep = keep
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    # Carrega o manifesto (ou vazio se ainda não existir)
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return []
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Manifesto de snapshots ilegível, ignorando (%s)", e)
+            return []
+
+    # Salva o manifesto de forma atômica
+    def save_manifest(self, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    # Registra um snapshot e apaga os mais antigos além de keep
+    def add(self, entry):
+        entries = self.load_manifest() + [entry]
+        expired, entries = entries[:-self.keep], entries[-self.keep:]
+        self.save_manifest(entries)
+        for old in expired:
+            try:
+                os.remove(os.path.join(self.directory, old['file']))
+            except OSError:
+                pass
+
+    def writer(self, url=None, months=None, scraped_at=None):
+        return SnapshotWriter(self, url, months, scraped_at)
+
+    # Grava um DataFrame limpo inteiro como um novo snapshot
+    def write(self, data, url=None, months=None, scraped_at=None):
+        writer = self.writer(url, months, scraped_at)
+        try:
+            writer.write(data)
+            return writer.commit()
+        finally:
+            writer.abort()
+
+    # Entrada mais recente do manifesto (opcionalmente só de uma URL)
+    def latest(self, url=None):
+        entries = [entry for entry in self.load_manifest() if url is None or entry.get('url') == url]
+        return entries[-1] if entries else None
+
+    # Lê um snapshot (o mais recente, por padrão) com o arquivo mapeado em memória;
+    # region e game voltam como categorias. Retorna None se não houver snapshot legível.
+    def read(self, entry=None, columns=None):
+        import pyarrow.parquet as pq
+
+        entry = entry or self.latest()
+        if entry is None:
+            return None
+        columns = columns or SNAPSHOT_COLUMNS
+        try:
+            table = pq.read_table(
+                os.path.join(self.directory, entry['file']), columns=columns, memory_map=True,
+                read_dictionary=[column for column in CATEGORY_COLUMNS if column in columns]
+            )
+        except (OSError, ValueError) as e:
+            logger.error("Snapshot '%s' ilegível: %s", entry['id'], e)
+            return None
+        return table.to_pandas()
@@ -0,0 +1,167 @@
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+
+import pandas as pd
+
+from Analytics import rebuild_metrics
+from GameScraping import BACKENDS, GachaRevenueScraper, build_http_session
+from Metrics import configure_logging, inc, serve_metrics, set_gauge
+from db import DB_CONFIG, HISTORY_TABLE, METRICS_TABLE, PostgreSQLDatabase, history_frame, month_start, shift_month
+from etl import URL
+
+logger = logging.getLogger('backfill')
+
+# URL da visão de cada mês no site; {month} é o primeiro dia do mês (date)
+URL_TEMPLATE = URL + "?month={month:%Y-%m}"
+
+# Meses raspados ao mesmo tempo (cada um pode abrir um Chrome se o HTTP falhar no backend 'auto')
+BACKFILL_WORKERS = 4
+
+
+# Meses de start a end, inclusive
+def month_range(start, end):
+    months, month = [], month_start(start)
+    while month <= end:
+        months.append(month)
+        month = shift_month(month, 1)
+    return months
+
+
+# Lê um mês no formato AAAA-MM
+def parse_month(value):
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+# Raspa a visão de um mês e devolve suas linhas no formato do histórico.
+# Retorna None se o site não tiver a visão desse mês (página sem tabela ou mostrando outro mês).
+def scrape_month(url, month, backend='auto', session=None, scraped_at=None):
+    import requests
+
+    scraper = GachaRevenueScraper(url, backend=backend, session=session)
+    try:
+        try:
+            scraper.fetch_data(display=False)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            raise
+        data = scraper.get_data()
+        shown = scraper.months.get('current_month')
+        if data is None or data.empty or shown is None:
+            return None
+        if month_start(shown) != month:
+            logger.warning("%s mostra %s em vez de %s; mês ignorado.", url, f"{shown:%Y-%m}", f"{month:%Y-%m}")
+            return None
+
+        rows = history_frame(data, scraper.months, scraped_at)
+        # O mês anterior também aparece como mês atual na visão dele, onde o valor é o definitivo
+        rows['view_month'] = rows['month'] == month
+        return rows
+    finally:
+        scraper.close_driver()
+
+
+# Raspa os meses em paralelo (no máximo workers ao mesmo tempo) e grava tudo no histórico com uma única carga.
+# Retorna um resumo com meses carregados, indisponíveis, com erro e a vazão em meses por minuto.
+def run_backfill(db, months, url_template=URL_TEMPLATE, workers=BACKFILL_WORKERS, backend='auto',
+                 table_name=HISTORY_TABLE):
+    scraped_at = pd.Timestamp.now(tz='UTC')
+    session = build_http_session(pool_size=workers) if backend in ('http', 'auto') else None
+    frames, unavailable, failed = [], [], []
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backfill') as executor:
+            futures = {
+                executor.submit(scrape_month, url_template.format(month=month), month, backend, session, scraped_at):
+                    month
+                for month in months
+            }
+            for future in as_completed(futures):
+                month = futures[future]
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    logger.error("Erro ao raspar %s: %s", f"{month:%Y-%m}", e)
+                    failed.append(month)
+                    inc('backfill_months_total', status='error')
+                    continue
+                if rows is None:
+                    logger.info("Visão de %s não disponível.", f"{month:%Y-%m}")
+                    unavailable.append(month)
+                    inc('backfill_months_total', status='unavailable')
+                    continue
+                frames.append(rows)
+                inc('backfill_months_total', status='ok')
+                logger.info("Mês %s raspado: %d linhas (%d de %d).", f"{month:%Y-%m}", len(rows),
+                            len(frames) + len(unavailable) + len(failed), len(months), extra={'rows': len(rows)})
+    finally:
+        if session is not None:
+            session.close()
+    scrape_s = time.perf_counter() - start
+
+    loaded = 0
+    if frames:
+        # Para cada (region, game, month) fica o valor da visão do próprio mês, se ela foi raspada
+        rows = pd.concat(frames, ignore_index=True).sort_values('view_month', kind='stable').drop_duplicates(
+            subset=['region', 'game', 'month'], keep='last'
+        )
+        if not db.bulk_load_history(table_name, rows):
+            raise RuntimeError("Falha na carga em massa do histórico.")
+        loaded = len(rows)
+
+    elapsed = time.perf_counter() - start
+    months_per_minute = len(frames) / elapsed * 60 if elapsed else 0.0
+    set_gauge('backfill_months_per_minute', months_per_minute)
+    summary = {
+        'months': len(frames), 'unavailable': len(unavailable), 'failed': len(failed), 'rows': loaded,
+        'scrape_s': scrape_s, 'elapsed_s': elapsed, 'months_per_minute': months_per_minute
+    }
+    logger.info("Backfill concluído: %d meses (%d indisponíveis, %d com erro), %d linhas em %.1fs "
+                "(%.1f meses/min)", len(frames), len(unavailable), len(failed), loaded, elapsed, months_per_minute,
+                extra=summary)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Backfill do histórico: raspa as visões mensais do site em paralelo e carrega no banco."
+    )
+    parser.add_argument('--start', type=parse_month, required=True, help="Primeiro mês (AAAA-MM).")
+    parser.add_argument('--end', type=parse_month, default=month_start(date.today()),
+                        help="Último mês (AAAA-MM); padrão: o mês atual.")
+    parser.add_argument('--url-template', default=URL_TEMPLATE,
+                        help="URL da visão de cada mês, com {month} formatável, ex.: '...?month={month:%%Y-%%m}'.")
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS, help="Meses raspados em paralelo.")
+    parser.add_argument('--backend', default='auto', choices=BACKENDS)
+    parser.add_argument('--no-metrics', action='store_true',
+                        help="Não recalcula a tabela de métricas de receita depois da carga.")
+    parser.add_argument('--metrics-port', type=int, help="Expõe as métricas do backfill em :PORT/metrics.")
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--plain-logs', action='store_true', help="Log em texto simples em vez de JSON.")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers precisa ser pelo menos 1.")
+
+    configure_logging(args.log_level, structured=not args.plain_logs)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    db = PostgreSQLDatabase(DB_CONFIG)
+    try:
+        db.connect()
+        db.create_history_table(HISTORY_TABLE)
+        summary = run_backfill(db, month_range(args.start, args.end), args.url_template, args.workers, args.backend)
+        # O backfill mexe em meses antigos de quase todas as séries: as métricas são recalculadas por inteiro
+        if summary['rows'] and not args.no_metrics:
+            db.create_metrics_table(METRICS_TABLE)
+            rebuild_metrics(db, HISTORY_TABLE, METRICS_TABLE)
+    finally:
+        db.close_connection()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,664 @@
+import argparse
+import json
+import multiprocessing
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import os
+
+import pandas as pd
+
+from Analytics import compute_metrics, rebuild_metrics, update_metrics
+from CleaningData import DataCleaner
+from db import PostgreSQLDatabase
+from Graficos import ChartGenerator
+from GameScraping import (
+    CHUNK_SIZE, GachaRevenueScraper, build_chrome_driver, build_table_dataframe, iter_table_chunks, parse_table_html
+)
+from ScrapingPool import ScraperPool
+from SnapshotStore import SnapshotStore
+from fixtures import (
+    FIXTURE_SIZES, build_raw_revenue_frame, disposable_postgres, iter_revenue_page_html, revenue_page_path,
+    build_history_frame, serve_fixtures, write_month_pages
+)
+
+# Baseline versionado com os resultados de referência
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+
+# Aumento relativo de tempo a partir do qual um resultado conta como regressão
+REGRESSION_TOLERANCE = 0.25
+# Tempos abaixo deste limite (em segundos) são ruído demais para comparar
+MIN_COMPARE_SECONDS = 0.05
+
+# Tamanhos da comparação de limpeza: o padrão e o de --large
+CLEAN_SIZES = (100_000,)
+LARGE_CLEAN_SIZES = (100_000, 1_000_000)
+
+# Benchmarks que comparam números de workers/drivers: só significativos em máquinas com mais de uma CPU
+PARALLEL_BENCHMARKS = ('pool', 'backfill')
+
+
+# Mede o tempo médio de uma função em várias repetições
+def time_call(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings)
+
+
+# Compara os modos de extração da tabela sobre a página salva
+def bench_extract_table(n_rows=300, repeat=3):
+    driver = build_chrome_driver(headless=True)
+    try:
+        driver.get(pathlib.Path(revenue_page_path(n_rows)).as_uri())
+
+        results = {}
+        frames = {}
+        for mode in ('webdriver', 'html'):
+            scraper = GachaRevenueScraper(driver.current_url, extract_mode=mode)
+            scraper.driver = driver
+            best, mean = time_call(scraper.extract_table, repeat)
+            frames[mode] = scraper.get_data()
+            results[mode] = {'best_s': best, 'mean_s': mean}
+            print(f"extract_table[{mode}] ({n_rows} linhas): melhor {best:.3f}s, média {mean:.3f}s")
+
+        if not frames['html'].equals(frames['webdriver']):
+            print("AVISO: os modos de extração produziram DataFrames diferentes!")
+        print(f"Aceleração: {results['webdriver']['best_s'] / results['html']['best_s']:.1f}x")
+        return results
+    finally:
+        driver.quit()
+
+
+# Compara os backends de download servindo a página salva por HTTP local
+def bench_fetch_backends(n_rows=300, repeat=3, backends=('http', 'headless')):
+    page = os.path.basename(revenue_page_path(n_rows))
+    results = {}
+    with serve_fixtures() as base_url:
+        url = f"{base_url}/{page}"
+        frames = {}
+        for backend in backends:
+            def fetch():
+                scraper = GachaRevenueScraper(url, backend=backend)
+                try:
+                    scraper.start_driver()
+                    scraper.extract_table()
+                    frames[backend] = scraper.get_data()
+                finally:
+                    scraper.close_driver()
+
+            best, mean = time_call(fetch, repeat)
+            results[backend] = {'best_s': best, 'mean_s': mean}
+            print(f"fetch[{backend}] ({n_rows} linhas): melhor {best:.3f}s, média {mean:.3f}s")
+
+        reference = frames[backends[0]]
+        for backend, frame in frames.items():
+            if not frame.equals(reference):
+                print(f"AVISO: o backend '{backend}' produziu um DataFrame diferente!")
+    return results
+
+
+# Mede a vazão (páginas/s) do ScraperPool para diferentes tamanhos de pool
+def bench_scraper_pool(n_rows=300, n_pages=32, sizes=(1, 2, 4)):
+    page = os.path.basename(revenue_page_path(n_rows))
+    results = {}
+    with serve_fixtures() as base_url:
+        urls = [f"{base_url}/{page}?page={i}" for i in range(n_pages)]
+        for size in sizes:
+            with ScraperPool(size=size) as pool:
+                start = time.perf_counter()
+                scraped = sum(1 for _, data in pool.scrape(urls) if not data.empty)
+                elapsed = time.perf_counter() - start
+            throughput = scraped / elapsed
+            results[size] = {'pages': scraped, 'elapsed_s': elapsed, 'pages_per_s': throughput}
+            print(f"ScraperPool(size={size}): {scraped} páginas em {elapsed:.2f}s ({throughput:.1f} páginas/s)")
+
+    base = results[sizes[0]]['pages_per_s'] / sizes[0]
+    for size in sizes:
+        print(f"Eficiência com {size} drivers: {results[size]['pages_per_s'] / (base * size):.0%}")
+    return results
+
+
+# Limpeza original (replace no DataFrame inteiro + apply elemento a elemento), usada como referência
+def legacy_clean_data(data):
+    data.replace({
+        '🇯🇵': "jp", '🇨🇳': "cn", '🇰🇷': "kr", '🇺🇸': "us", '☠️': 0, '🌐': 'WW'
+    }, inplace=True)
+    data.rename(columns={
+        'Last Month': 'previous_month',
+        'Current Month': 'current_month',
+        'Region': 'region',
+        'Game': 'game'
+    }, inplace=True)
+    for column in ('previous_month', 'current_month'):
+        data[column] = data[column].replace({r'\$': '', r',': ''}, regex=True).apply(pd.to_numeric, errors='coerce').fillna(0)
+    return data.iloc[:, data.columns.get_loc('region'):]
+
+
+# Compara a limpeza vetorizada com a original em tabelas sintéticas
+# (a original leva ~35s com 1 milhão de linhas: esse tamanho só roda com --large)
+def bench_clean_data(sizes=CLEAN_SIZES):
+    results = {}
+    for n_rows in sizes:
+        raw = build_raw_revenue_frame(n_rows)
+
+        start = time.perf_counter()
+        legacy = legacy_clean_data(raw.copy())
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cleaned = DataCleaner(raw.copy()).clean_data()
+        vectorized_s = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(
+            cleaned.astype({'region': object, 'game': object}), legacy, check_dtype=False
+        )
+
+        legacy_mb = legacy.memory_usage(deep=True).sum() / 1e6
+        cleaned_mb = cleaned.memory_usage(deep=True).sum() / 1e6
+        print(f"clean_data ({n_rows} linhas): original {legacy_s:.2f}s, vetorizado {vectorized_s:.2f}s "
+              f"({legacy_s / vectorized_s:.1f}x)")
+        print(f"Memória do resultado: original {legacy_mb:.1f} MB, categórico {cleaned_mb:.1f} MB "
+              f"({1 - cleaned_mb / legacy_mb:.0%} menor)")
+        results[n_rows] = {
+            'legacy_s': legacy_s, 'vectorized_s': vectorized_s,
+            'legacy_mb': legacy_mb, 'vectorized_mb': cleaned_mb
+        }
+    return results
+
+
+# Mede linhas/s de cada estratégia de upsert em um Postgres descartável (DSN em BENCH_PG_DSN)
+def bench_upsert(n_rows=50_000, strategies=('row', 'values', 'copy'), dsn=None):
+    dsn = dsn or os.environ.get('BENCH_PG_DSN')
+    if not dsn:
+        print("BENCH_PG_DSN não definido; benchmark de upsert ignorado.")
+        return {}
+
+    data = DataCleaner(build_raw_revenue_frame(n_rows, n_games=n_rows)).clean_data()
+    db = PostgreSQLDatabase({'dsn': dsn})
+    db.connect()
+    results = {}
+    try:
+        for strategy in strategies:
+            table_name = f"bench_upsert_{strategy}"
+            with db.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+            db.create_table(table_name)
+            # Primeira carga insere, a segunda exercita o caminho de atualização
+            for phase in ('insert', 'update'):
+                rows = data if strategy != 'row' else data.head(5000)
+                db.insert_or_update_data(table_name, rows.copy(), strategy=strategy)
+                results[f"{strategy}_{phase}"] = db.last_upsert_stats
+            with db.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+    finally:
+        db.close_connection()
+
+    for name, stats in results.items():
+        print(f"upsert[{name}]: {stats['rows']} linhas, {stats['rows_per_second']:,.0f} linhas/s")
+    return results
+
+
+# Mede a geração dos gráficos (limpeza + agregação única + figuras) em tabelas sintéticas grandes
+def bench_charts(sizes=(100_000, 1_000_000), n_games=200):
+    results = {}
+    for n_rows in sizes:
+        data = DataCleaner(build_raw_revenue_frame(n_rows, n_games=n_games)).clean_data()
+        generator = ChartGenerator(data)
+
+        start = time.perf_counter()
+        generator.get_aggregates()
+        aggregates_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        charts = generator.generate_all_charts()
+        figures_s = time.perf_counter() - start
+
+        failed = [name for name, chart in charts.items() if chart is None]
+        if failed:
+            print(f"AVISO: gráficos não gerados: {failed}")
+        results[n_rows] = {
+            'aggregates_s': aggregates_s, 'figures_s': figures_s, 'payload_bytes': dict(generator.payload_sizes)
+        }
+        print(f"generate_all_charts ({n_rows} linhas, {n_games} jogos): "
+              f"agregação {aggregates_s:.2f}s, figuras {figures_s:.2f}s")
+    return results
+
+
+# Compara o tempo de carga da tabela limpa a partir do snapshot Parquet local e do Postgres (DSN em BENCH_PG_DSN)
+def bench_snapshot_load(sizes=(100_000, 1_000_000), repeat=3, dsn=None):
+    dsn = dsn or os.environ.get('BENCH_PG_DSN')
+    db = None
+    if dsn:
+        db = PostgreSQLDatabase({'dsn': dsn})
+        db.connect()
+    else:
+        print("BENCH_PG_DSN não definido; só o snapshot será medido.")
+
+    results = {}
+    try:
+        for n_rows in sizes:
+            data = DataCleaner(build_raw_revenue_frame(n_rows, n_games=n_rows)).clean_data()
+            with tempfile.TemporaryDirectory() as directory:
+                store = SnapshotStore(directory)
+                entry = store.write(data)
+                best, mean = time_call(lambda: store.read(entry), repeat)
+                size_mb = os.path.getsize(os.path.join(directory, entry['file'])) / 1e6
+            results[f"snapshot_{n_rows}"] = {'best_s': best, 'mean_s': mean, 'file_mb': size_mb}
+            print(f"carga do snapshot ({n_rows} linhas, {size_mb:.1f} MB): melhor {best:.3f}s, média {mean:.3f}s")
+
+            if db is not None:
+                table_name = 'bench_snapshot_load'
+                with db.cursor() as cur:
+                    cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+                db.create_table(table_name)
+                db.insert_or_update_data(table_name, data.copy())
+                best_db, mean_db = time_call(lambda: db.fetch_data(table_name), repeat)
+                with db.cursor() as cur:
+                    cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+                results[f"postgres_{n_rows}"] = {'best_s': best_db, 'mean_s': mean_db}
+                print(f"carga do Postgres ({n_rows} linhas): melhor {best_db:.3f}s, média {mean_db:.3f}s "
+                      f"({best_db / best:.1f}x o snapshot)")
+    finally:
+        if db is not None:
+            db.close_connection()
+    return results
+
+
+# Roda extração -> limpeza -> (upsert) sobre uma página sintética e mede o crescimento do pico de memória.
+# Deve rodar em um processo novo, já que ru_maxrss só cresce.
+def stream_pipeline_peak(n_rows, chunk_size=CHUNK_SIZE, materialize=False, dsn=None):
+    import resource
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    db = None
+    if dsn:
+        db = PostgreSQLDatabase({'dsn': dsn})
+        db.connect()
+        db.create_table('bench_stream')
+
+    start = time.perf_counter()
+    fragments = iter_revenue_page_html(n_rows)
+    if materialize:
+        # Caminho sem streaming: página inteira -> todas as linhas -> um único DataFrame
+        headers, rows = parse_table_html(''.join(fragments))
+        chunks = [DataCleaner(build_table_dataframe(headers, rows)).clean_data()]
+        del rows
+    else:
+        chunks = (
+            DataCleaner(build_table_dataframe(headers, rows)).clean_data()
+            for headers, rows in iter_table_chunks(fragments, chunk_size)
+        )
+
+    total = 0
+    try:
+        for chunk in chunks:
+            if db is not None:
+                db.insert_or_update_data('bench_stream', chunk)
+            total += len(chunk)
+    finally:
+        if db is not None:
+            with db.cursor() as cur:
+                cur.execute("DROP TABLE IF EXISTS bench_stream")
+            db.close_connection()
+
+    elapsed = time.perf_counter() - start
+    peak_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb) / 1024
+    return {'rows': total, 'elapsed_s': elapsed, 'rows_per_s': total / elapsed, 'peak_growth_mb': peak_mb}
+
+
+# Verifica que o pico de memória do modo streaming não cresce com o número de linhas (cada medida em um processo novo)
+def bench_streaming(sizes=(200_000, 2_000_000), chunk_size=CHUNK_SIZE, dsn=None):
+    dsn = dsn or os.environ.get('BENCH_PG_DSN')
+    context = multiprocessing.get_context('spawn')
+    runs = [('materializado', sizes[0], True)] + [('streaming', n_rows, False) for n_rows in sizes]
+
+    results = {}
+    for mode, n_rows, materialize in runs:
+        with context.Pool(1) as pool:
+            result = pool.apply(stream_pipeline_peak, (n_rows, chunk_size, materialize, dsn))
+        results[f"{mode}_{n_rows}"] = result
+        print(f"pipeline {mode} ({result['rows']} linhas): {result['elapsed_s']:.1f}s, "
+              f"{result['rows_per_s']:,.0f} linhas/s, pico de memória +{result['peak_growth_mb']:.0f} MB")
+
+    smallest, largest = results[f"streaming_{sizes[0]}"], results[f"streaming_{sizes[-1]}"]
+    print(f"Streaming: {sizes[-1] / sizes[0]:.0f}x mais linhas, "
+          f"{largest['peak_growth_mb'] / max(smallest['peak_growth_mb'], 1):.1f}x o pico de memória "
+          f"(lotes de {chunk_size} linhas)")
+    return results
+
+
+# Mede cada etapa do pipeline sem rede externa nem Chrome: páginas salvas servidas localmente (extract_table
+# via backend HTTP), tabelas sintéticas maiores para as demais etapas e um Postgres descartável para o banco
+def bench_pipeline(sizes=FIXTURE_SIZES, synthetic_sizes=(100_000,), repeat=3, dsn=None):
+    dsn = dsn or os.environ.get('BENCH_PG_DSN')
+    db = None
+    if dsn:
+        db = PostgreSQLDatabase({'dsn': dsn})
+        db.connect()
+    else:
+        print("Nenhum Postgres disponível; insert_or_update_data e fetch_data ignorados.")
+
+    # Garante que as páginas existem antes de subir o servidor
+    pages = {n_rows: os.path.basename(revenue_page_path(n_rows)) for n_rows in sizes}
+    raw_frames = {}
+    results = {}
+    try:
+        with serve_fixtures() as base_url:
+            for n_rows, page in pages.items():
+                scraper = GachaRevenueScraper(f"{base_url}/{page}", backend='http')
+                try:
+                    scraper.start_driver()
+                    best, mean = time_call(scraper.extract_table, repeat)
+                    raw_frames[f"fixture_{n_rows}"] = scraper.get_data()
+                finally:
+                    scraper.close_driver()
+                results[f"fixture_{n_rows}"] = {'rows': n_rows, 'extract_table': {'best_s': best, 'mean_s': mean}}
+
+        for n_rows in synthetic_sizes:
+            raw_frames[f"synthetic_{n_rows}"] = build_raw_revenue_frame(n_rows, n_games=n_rows)
+            results[f"synthetic_{n_rows}"] = {'rows': n_rows}
+
+        for name, raw in raw_frames.items():
+            stages = results[name]
+            best, mean = time_call(lambda: DataCleaner(raw.copy()).clean_data(), repeat)
+            stages['clean_data'] = {'best_s': best, 'mean_s': mean}
+            data = DataCleaner(raw.copy()).clean_data()
+
+            if db is not None:
+                table_name = 'bench_pipeline'
+                with db.cursor() as cur:
+                    cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+                db.create_table(table_name)
+                # Primeira chamada insere, as seguintes exercitam o caminho de atualização
+                best, mean = time_call(lambda: db.insert_or_update_data(table_name, data.copy()), repeat)
+                stages['insert_or_update_data'] = {'best_s': best, 'mean_s': mean}
+                best, mean = time_call(lambda: db.fetch_data(table_name), repeat)
+                stages['fetch_data'] = {'best_s': best, 'mean_s': mean}
+                with db.cursor() as cur:
+                    cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+
+            best, mean = time_call(lambda: ChartGenerator(data).generate_all_charts(), repeat)
+            stages['generate_all_charts'] = {'best_s': best, 'mean_s': mean}
+
+            print(f"pipeline[{name}] ({stages['rows']} linhas): " + ', '.join(
+                f"{stage} {timing['best_s']:.3f}s" for stage, timing in stages.items() if stage != 'rows'
+            ))
+    finally:
+        if db is not None:
+            db.close_connection()
+    return results
+
+
+# Mede a vazão do backfill (meses/min) para diferentes números de workers, com visões mensais sintéticas.
+# Sem dsn, usa o Postgres descartável de disposable_postgres (BENCH_PG_DSN, pgserver ou initdb).
+def bench_backfill(n_months=24, n_rows=3000, workers=(1, 4), dsn=None):
+    from contextlib import nullcontext
+    from datetime import date
+
+    from backfill import month_range, run_backfill
+
+    with disposable_postgres() if dsn is None else nullcontext(dsn) as dsn:
+        if not dsn:
+            print("AVISO: nenhum Postgres disponível (BENCH_PG_DSN, pgserver ou initdb); benchmark de backfill "
+                  "ignorado.")
+            return {}
+
+        months = month_range(date(2000, 1, 1), date(2000 + (n_months - 1) // 12, (n_months - 1) % 12 + 1, 1))
+        db = PostgreSQLDatabase({'dsn': dsn})
+        db.connect()
+        results = {}
+        try:
+            with tempfile.TemporaryDirectory() as directory, serve_fixtures(directory) as base_url:
+                template = write_month_pages(directory, months, n_rows)
+                for size in workers:
+                    table_name = 'bench_backfill'
+                    with db.cursor() as cur:
+                        cur.execute(f"DROP TABLE IF EXISTS {table_name} CASCADE")
+                    db.create_history_table(table_name)
+                    summary = run_backfill(db, months, f"{base_url}/{template}", workers=size, backend='http',
+                                           table_name=table_name)
+                    with db.cursor() as cur:
+                        cur.execute(f"DROP TABLE IF EXISTS {table_name} CASCADE")
+                    results[size] = summary
+                    print(f"backfill ({size} workers): {summary['months']} meses, {summary['rows']} linhas em "
+                          f"{summary['elapsed_s']:.2f}s ({summary['months_per_minute']:.0f} meses/min)")
+        finally:
+            db.close_connection()
+    return results
+
+
+# Mede o cálculo vetorizado das métricas em um histórico sintético e, com Postgres, compara a reconstrução
+# completa da tabela materializada com a atualização incremental de uma fração das séries
+def bench_analytics(n_series=50_000, n_months=24, changed_fraction=0.01, repeat=3, dsn=None):
+    history = build_history_frame(n_series, n_months)
+    best, mean = time_call(lambda: compute_metrics(history), repeat)
+    results = {'compute': {'rows': len(history), 'best_s': best, 'mean_s': mean}}
+    print(f"compute_metrics ({n_series} séries x {n_months} meses, {len(history)} linhas): "
+          f"melhor {best:.2f}s, média {mean:.2f}s")
+
+    dsn = dsn or os.environ.get('BENCH_PG_DSN')
+    if not dsn:
+        print("BENCH_PG_DSN não definido; reconstrução e atualização incremental ignoradas.")
+        return results
+
+    history_table, metrics_table = 'bench_analytics_history', 'bench_analytics_metrics'
+    db = PostgreSQLDatabase({'dsn': dsn})
+    db.connect()
+    try:
+        with db.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {history_table} CASCADE; DROP TABLE IF EXISTS {metrics_table}")
+        db.create_history_table(history_table)
+        db.create_metrics_table(metrics_table)
+        db.bulk_load_history(history_table, history.assign(scraped_at=pd.Timestamp.now(tz='UTC')))
+
+        best, mean = time_call(lambda: rebuild_metrics(db, history_table, metrics_table), repeat)
+        results['rebuild'] = {'best_s': best, 'mean_s': mean}
+
+        # Nova coleta do último mês para uma fração das séries
+        last_month = history['month'].max()
+        changed = history[history['month'] == last_month].sample(frac=changed_fraction, random_state=0)
+        changed = changed.assign(revenue=changed['revenue'] * 1.1, scraped_at=pd.Timestamp.now(tz='UTC'))
+        db.bulk_load_history(history_table, changed)
+        best, mean = time_call(lambda: update_metrics(db, changed, [last_month], history_table, metrics_table), repeat)
+        results['incremental'] = {'series': len(changed), 'best_s': best, 'mean_s': mean}
+
+        with db.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {history_table} CASCADE; DROP TABLE IF EXISTS {metrics_table}")
+    finally:
+        db.close_connection()
+
+    print(f"métricas materializadas: reconstrução {results['rebuild']['best_s']:.2f}s, incremental "
+          f"({len(changed)} séries) {results['incremental']['best_s']:.2f}s "
+          f"({results['rebuild']['best_s'] / results['incremental']['best_s']:.1f}x)")
+    return results
+
+
+# Pacotes pesados que cada ponto de entrada não deve carregar na importação
+DEFERRED_IMPORTS = {
+    'server': ('selenium', 'prettytable', 'requests', 'plotly.express'),
+    'etl': ('selenium', 'prettytable', 'plotly', 'dash'),
+    'db': ('selenium', 'plotly', 'dash'),
+}
+
+
+# Mede o tempo de importação dos pontos de entrada com python -X importtime, em um processo novo por repetição
+def bench_import_time(modules=tuple(DEFERRED_IMPORTS), repeat=3):
+    results = {}
+    for module in modules:
+        timings = []
+        for _ in range(repeat):
+            completed = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+            )
+            # Linhas no formato "import time: self [us] | cumulative | imported package"
+            loaded = {}
+            for line in completed.stderr.splitlines():
+                if line.startswith('import time:') and '|' in line:
+                    _, cumulative, name = line.split('|')
+                    if cumulative.strip().isdigit():
+                        loaded[name.strip()] = int(cumulative)
+            timings.append(loaded[module] / 1e6)
+
+        eager = [package for package in DEFERRED_IMPORTS.get(module, ()) if package in loaded]
+        results[module] = {'best_s': min(timings), 'mean_s': sum(timings) / len(timings), 'eager_imports': eager}
+        print(f"import {module}: melhor {min(timings):.3f}s, média {sum(timings) / len(timings):.3f}s")
+        if eager:
+            print(f"AVISO: 'import {module}' carregou pacotes que deveriam ser adiados: {eager}")
+    return results
+
+
+BENCHMARKS = {
+    'extract': bench_extract_table,
+    'backends': bench_fetch_backends,
+    'pool': bench_scraper_pool,
+    'clean': bench_clean_data,
+    'upsert': bench_upsert,
+    'charts': bench_charts,
+    'imports': bench_import_time,
+    'streaming': bench_streaming,
+    'snapshot': bench_snapshot_load,
+    'pipeline': bench_pipeline,
+    'backfill': bench_backfill,
+    'analytics': bench_analytics,
+}
+
+# Benchmarks que rodam sem Chrome nem rede externa (o padrão)
+OFFLINE_BENCHMARKS = ('pipeline', 'clean', 'charts', 'upsert', 'snapshot', 'backfill', 'analytics', 'imports')
+
+
+# Arredonda os números para 4 algarismos significativos, para que o baseline só mude com diferenças reais
+def round_results(value):
+    if isinstance(value, dict):
+        return {str(key): round_results(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [round_results(item) for item in value]
+    if isinstance(value, float):
+        return float(f"{value:.4g}")
+    return value
+
+
+# Com uma só CPU, os resultados com vários workers não medem paralelismo e não servem de referência
+def parallel_comparable(cpu_count=None):
+    return (cpu_count or os.cpu_count() or 1) > 1
+
+
+# Ambiente em que o baseline foi medido
+def environment_info():
+    import numpy
+    import pyarrow
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parallel_comparable': parallel_comparable(),
+        'pandas': pd.__version__,
+        'numpy': numpy.__version__,
+        'pyarrow': pyarrow.__version__,
+    }
+
+
+# Grava os resultados em JSON com chaves ordenadas (diffs legíveis entre execuções);
+# benchmarks que não rodaram agora mantêm o resultado anterior do arquivo (com aviso: podem estar desatualizados)
+def write_baseline(results, path=BASELINE_FILE):
+    previous = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f).get('results', {})
+    # Benchmarks ignorados (resultado vazio, ex.: sem Postgres) contam como não medidos
+    results = {name: result for name, result in results.items() if result}
+    kept = sorted(previous.keys() - results.keys())
+    if kept:
+        print(f"AVISO: resultados anteriores mantidos no baseline sem nova medição (podem estar desatualizados "
+              f"ou ter sido medidos em outro ambiente): {kept}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment_info(), 'results': {**previous, **round_results(results)}}, f,
+                  indent=2, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
+    print(f"Resultados gravados em {path}")
+
+
+# Achata os tempos em {'pipeline/fixture_300/clean_data/best_s': 0.01, ...} (médias ficam de fora, são mais ruidosas)
+def flatten_timings(results, prefix=''):
+    timings = {}
+    for key, value in results.items():
+        path = f"{prefix}/{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            timings.update(flatten_timings(value, path))
+        elif (key.endswith('_s') or key == 'seconds') and key != 'mean_s' and isinstance(value, (int, float)):
+            timings[path] = value
+    return timings
+
+
+# Compara os melhores tempos com o baseline; retorna a lista de regressões acima da tolerância.
+# Os benchmarks paralelos ficam de fora se o baseline ou a máquina atual tiver uma só CPU.
+def compare_baseline(results, path=BASELINE_FILE, tolerance=REGRESSION_TOLERANCE):
+    with open(path, encoding='utf-8') as f:
+        stored = json.load(f)
+    baseline = flatten_timings(stored['results'])
+    current = flatten_timings(round_results(results))
+
+    baseline_cpus = stored.get('environment', {}).get('cpu_count') or 1
+    if not (parallel_comparable(baseline_cpus) and parallel_comparable()):
+        skipped = sorted({key.split('/', 1)[0] for key in current} & set(PARALLEL_BENCHMARKS))
+        if skipped:
+            print(f"Resultados paralelos ignorados na comparação (baseline com {baseline_cpus} CPU(s), máquina "
+                  f"atual com {os.cpu_count()}): {skipped}")
+        current = {key: value for key, value in current.items() if key.split('/', 1)[0] not in PARALLEL_BENCHMARKS}
+
+    regressions = []
+    for key in sorted(current.keys() & baseline.keys()):
+        if max(baseline[key], current[key]) < MIN_COMPARE_SECONDS:
+            continue
+        ratio = current[key] / baseline[key]
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+            print(f"REGRESSÃO {key}: {baseline[key]:.4g}s -> {current[key]:.4g}s ({ratio:.2f}x)")
+        elif ratio < 1 - tolerance:
+            print(f"melhora {key}: {baseline[key]:.4g}s -> {current[key]:.4g}s ({ratio:.2f}x)")
+    print(f"{len(current.keys() & baseline.keys())} tempos no baseline, {len(regressions)} regressões "
+          f"(tolerância {tolerance:.0%}, tempos abaixo de {MIN_COMPARE_SECONDS}s ignorados)")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline de receitas.")
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f"Um ou mais de {sorted(BENCHMARKS)}; padrão: os que rodam offline {OFFLINE_BENCHMARKS}.")
+    parser.add_argument('--write-baseline', nargs='?', const=BASELINE_FILE, metavar='ARQUIVO',
+                        help="Grava os resultados como novo baseline JSON.")
+    parser.add_argument('--compare', nargs='?', const=BASELINE_FILE, metavar='ARQUIVO',
+                        help="Compara com um baseline JSON e sai com código 1 se houver regressões.")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument('--large', action='store_true',
+                        help=f"Inclui a limpeza com {LARGE_CLEAN_SIZES[-1]:,} linhas (a versão original leva ~35s).")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"benchmarks desconhecidos: {sorted(unknown)}")
+
+    benchmarks = dict(BENCHMARKS)
+    if args.large:
+        benchmarks['clean'] = lambda: bench_clean_data(LARGE_CLEAN_SIZES)
+    if not parallel_comparable():
+        print("AVISO: máquina com uma só CPU; os resultados paralelos (pool, backfill) não medem paralelismo.")
+
+    # Um único Postgres descartável para todos os benchmarks (herdado pelos processos filhos via ambiente)
+    with disposable_postgres() as dsn:
+        if dsn:
+            os.environ['BENCH_PG_DSN'] = dsn
+        results = {name: benchmarks[name]() for name in args.benchmarks or OFFLINE_BENCHMARKS}
+
+    if args.write_baseline:
+        write_baseline(results, args.write_baseline)
+    if args.compare and compare_baseline(results, args.compare, args.tolerance):
+        sys.exit(1)
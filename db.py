@@ -1,7 +1,21 @@
+import io
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from uuid import uuid4
+
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import pandas as pd
 
+from Metrics import DB_SECONDS, inc, timer
+
+logger = logging.getLogger(__name__)
+
 # Configurações do banco de dados
 DB_CONFIG = {
     "dbname": "postgres",
@@ -11,23 +25,175 @@ DB_CONFIG = {
     "port": "5432"
 }
 
+# Colunas gravadas pelo upsert, na ordem da tabela
+UPSERT_COLUMNS = ['region', 'game', 'current_month', 'previous_month']
+
+# Estratégias de upsert disponíveis
+UPSERT_STRATEGIES = ('auto', 'copy', 'values', 'row')
+
+# A partir deste número de linhas o COPY compensa o custo da tabela de staging
+COPY_THRESHOLD = 5000
+
+# No upsert linha a linha, só uma a cada ROW_LOG_SAMPLE linhas vai para o log (em nível DEBUG)
+ROW_LOG_SAMPLE = 1000
+
+# Tabela com a receita atual de cada (region, game)
+REVENUE_TABLE = 'gacha_revenue'
+
+# Tabela de histórico em formato longo (region, game, month, revenue), particionada por mês
+HISTORY_TABLE = 'revenue_snapshots'
+HISTORY_COLUMNS = ['region', 'game', 'month', 'revenue', 'scraped_at']
+
+# Tabela de métricas derivadas do histórico, uma linha por (region, game, month)
+METRICS_TABLE = 'revenue_metrics'
+METRIC_COLUMNS = [
+    'region', 'game', 'month', 'revenue', 'mom_growth', 'rolling_avg', 'rank', 'rank_change', 'region_share'
+]
+
+# Tabela com a versão dos dados de cada tabela (incrementada a cada gravação)
+VERSION_TABLE = 'data_versions'
+
+# Tamanho dos lotes lidos pelo cursor no servidor em leituras grandes
+FETCH_CHUNK_SIZE = 50_000
+
+# Expressões que reproduzem DataCleaner.clean_data_graph no servidor, para agrupar já com os nomes limpos
+GRAPH_KEY_EXPRESSIONS = {
+    'region': sql.SQL("btrim(region)"),
+    'game': sql.SQL("btrim(replace(game, E'\\n', ' '))"),
+    'month': sql.SQL("month")
+}
+
+
+# Primeiro dia do mês de uma data
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+# Primeiro dia do mês deslocado em offset meses
+def shift_month(value, offset):
+    index = value.year * 12 + value.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+# Converte a tabela limpa (formato largo) em linhas do histórico (region, game, month, revenue, scraped_at);
+# months mapeia coluna -> mês, ex.: {'current_month': date(2024, 10, 1)}
+def history_frame(data, months, scraped_at=None):
+    value_columns = [column for column in months if column in data.columns]
+    rows = data[['region', 'game'] + value_columns].melt(
+        id_vars=['region', 'game'], var_name='column', value_name='revenue'
+    )
+    rows['month'] = rows.pop('column').map({c: month_start(m) for c, m in months.items()})
+    rows['revenue'] = pd.to_numeric(rows['revenue'], errors='coerce')
+    rows['scraped_at'] = pd.Timestamp(scraped_at or pd.Timestamp.now(tz='UTC'))
+    return rows.dropna(subset=['region', 'game']).drop_duplicates(
+        subset=['region', 'game', 'month'], keep='last'
+    )[HISTORY_COLUMNS]
+
+
 class PostgreSQLDatabase:
-    # Inicializa a conexão com o PostgreSQL
-    def __init__(self, config):
+    # Inicializa o pool de conexões com o PostgreSQL (criado sob demanda em connect)
+    def __init__(self, config, min_connections=1, max_connections=10, connect_retries=3, retry_backoff=0.5,
+                 failure_cooldown=10):
         self.config = config
-        self.conn = None
-        self.cursor = None
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.connect_retries = connect_retries
+        self.retry_backoff = retry_backoff
+        # Depois de uma falha de conexão, novos pedidos falham na hora por failure_cooldown segundos
+        self.failure_cooldown = failure_cooldown
+        self.last_connect_failure = None
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        # Limita os empréstimos ao tamanho do pool: quem excede espera em vez de receber PoolError
+        self.pool_slots = threading.BoundedSemaphore(max_connections)
+        self.last_upsert_stats = None
 
-    # Conecta ao banco de dados
+    # Cria o pool de conexões, tentando novamente com backoff exponencial (a espera é feita fora do lock).
+    # Se uma conexão falhou há menos de failure_cooldown segundos, falha na hora em vez de refazer o ciclo:
+    # com o banco fora do ar, cada requisição do dashboard cai logo no snapshot em vez de esperar na fila.
+    @timer(DB_SECONDS, operation='connect')
     def connect(self):
+        for attempt in range(1, self.connect_retries + 1):
+            with self.pool_lock:
+                if self.pool is not None:
+                    return
+                failed_ago = None if self.last_connect_failure is None else time.monotonic() - self.last_connect_failure
+                if attempt == 1 and failed_ago is not None and failed_ago < self.failure_cooldown:
+                    raise psycopg2.OperationalError(
+                        f"banco de dados indisponível (última falha de conexão há {failed_ago:.1f}s)"
+                    )
+                try:
+                    self.pool = ThreadedConnectionPool(self.min_connections, self.max_connections, **self.config)
+                    self.last_connect_failure = None
+                    logger.info("Conexão bem-sucedida com o banco de dados!")
+                    return
+                except psycopg2.OperationalError as e:
+                    self.last_connect_failure = time.monotonic()
+                    if attempt == self.connect_retries:
+                        raise
+                    error = e
+            delay = self.retry_backoff * 2 ** (attempt - 1)
+            logger.warning("Erro ao conectar ao banco de dados (%s); nova tentativa em %.1fs...", error, delay)
+            time.sleep(delay)
+
+    # Empresta uma conexão do pool; faz commit ao sair ou rollback em caso de erro
+    @contextmanager
+    def connection(self):
+        if self.pool is None:
+            self.connect()
+
+        with self.pool_slots:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                self.pool.putconn(conn, close=bool(conn.closed))
+
+    # Abre um cursor em uma conexão do pool (name cria um cursor no servidor)
+    @contextmanager
+    def cursor(self, name=None):
+        with self.connection() as conn:
+            with conn.cursor(name=name) as cur:
+                yield cur
+
+    # Cria a tabela de versões usada para invalidar caches quando os dados mudam
+    def create_version_table(self, cur):
+        cur.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {versions} (
+                table_name TEXT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """).format(versions=sql.Identifier(VERSION_TABLE)))
+
+    # Incrementa a versão dos dados de uma tabela (na mesma transação da gravação)
+    def bump_data_version(self, cur, table_name):
+        cur.execute(sql.SQL("""
+            INSERT INTO {versions} (table_name, version) VALUES (%s, 1)
+            ON CONFLICT (table_name) DO UPDATE SET version = {versions}.version + 1, updated_at = now();
+        """).format(versions=sql.Identifier(VERSION_TABLE)), (table_name,))
+
+    # Versão atual dos dados de uma tabela (None se não houver controle de versão)
+    @timer(DB_SECONDS, operation='data_version')
+    def fetch_data_version(self, table_name):
         try:
-            self.conn = psycopg2.connect(**self.config)
-            self.cursor = self.conn.cursor()
-            print("Conexão bem-sucedida com o banco de dados!")
+            with self.cursor() as cur:
+                cur.execute(sql.SQL("SELECT version FROM {versions} WHERE table_name = %s").format(
+                    versions=sql.Identifier(VERSION_TABLE)
+                ), (table_name,))
+                row = cur.fetchone()
+            return row[0] if row else 0
         except Exception as e:
-            print(f"Erro ao conectar ao banco de dados: {e}")
-   
+            logger.error("Erro ao buscar versão dos dados: %s", e)
+            return None
+
     # Cria a tabela no banco de dados
+    @timer(DB_SECONDS, operation='create_table')
     def create_table(self, table_name):
         
         try:
@@ -41,15 +207,20 @@ class PostgreSQLDatabase:
                     UNIQUE(region, game)  -- Garantir unicidade com base em region e game
                 );
             """).format(table=sql.Identifier(table_name))
-            self.cursor.execute(query)
-            self.conn.commit()
-            print(f"Tabela '{table_name}' criada com sucesso!")
+            with self.cursor() as cur:
+                cur.execute(query)
+                self.create_version_table(cur)
+            logger.info("Tabela '%s' criada com sucesso!", table_name)
         except Exception as e:
-            print(f"Erro ao criar tabela: {e}")
+            logger.error("Erro ao criar tabela: %s", e)
 
     # Insere ou atualiza dados na tabela
-    def insert_or_update_data(self, table_name, data):
+    @timer(DB_SECONDS, operation='upsert')
+    def insert_or_update_data(self, table_name, data, strategy='auto'):
         try:
+            if strategy not in UPSERT_STRATEGIES:
+                raise ValueError(f"Estratégia de upsert inválida: {strategy}. Use uma de {UPSERT_STRATEGIES}.")
+
             # Renomeando as colunas para que sejam consistentes com o banco
             data.rename(columns={
                 'Region': 'region',
@@ -57,54 +228,484 @@ class PostgreSQLDatabase:
                 'Last Month': 'previous_month',
                 'Current Month': 'current_month'
             }, inplace=True)
-            print("Data ready for insertion:")
-            print(data.head())  # Verifique os dados antes de inseri-los
+            logger.debug("Data ready for insertion:\n%s", data.head())  # Verifique os dados antes de inseri-los
 
             # Garantindo que as colunas de receita sejam numéricas
             data['current_month'] = pd.to_numeric(data['current_month'], errors='coerce')
             data['previous_month'] = pd.to_numeric(data['previous_month'], errors='coerce')
 
+            if strategy == 'auto':
+                strategy = 'copy' if len(data) >= COPY_THRESHOLD else 'values'
+
+            start = time.perf_counter()
+            with self.cursor() as cur:
+                if strategy == 'copy':
+                    self.upsert_copy(cur, table_name, data)
+                elif strategy == 'values':
+                    self.upsert_values(cur, table_name, data)
+                else:
+                    self.upsert_rows(cur, table_name, data)
+                self.bump_data_version(cur, table_name)
+            elapsed = time.perf_counter() - start
+
+            rows_per_second = len(data) / elapsed if elapsed > 0 else float('inf')
+            self.last_upsert_stats = {
+                'strategy': strategy, 'rows': len(data), 'seconds': elapsed, 'rows_per_second': rows_per_second
+            }
+            inc('rows_upserted_total', len(data), strategy=strategy)
+            logger.info("Dados inseridos ou atualizados com sucesso! (%d linhas via %s em %.2fs, %.0f linhas/s)",
+                        len(data), strategy, elapsed, rows_per_second, extra={'rows': len(data), 'strategy': strategy})
+            return True
+        except Exception as e:
+            logger.error("Erro ao inserir ou atualizar dados: %s", e)
+            return False
+
+    # Cláusula de upsert comum a todas as estratégias
+    def upsert_conflict_clause(self):
+        return sql.SQL("""
+            ON CONFLICT (region, game)
+            DO UPDATE SET
+                current_month = EXCLUDED.current_month,
+                previous_month = EXCLUDED.previous_month
+        """)
+
+    # Envia o DataFrame por COPY para uma tabela temporária e faz um único INSERT ... SELECT
+    def upsert_copy(self, cur, table_name, data):
+        staging = sql.Identifier(f"{table_name}_staging")
+        cur.execute(sql.SQL("""
+            CREATE TEMP TABLE {staging} (
+                ord BIGINT,
+                region TEXT,
+                game TEXT,
+                current_month NUMERIC,
+                previous_month NUMERIC
+            ) ON COMMIT DROP;
+        """).format(staging=staging))
+
+        # A coluna ord preserva a ordem para que a última ocorrência de (region, game) prevaleça
+        buffer = io.StringIO()
+        data[UPSERT_COLUMNS].set_axis(pd.RangeIndex(len(data))).to_csv(buffer, header=False)
+        buffer.seek(0)
+        cur.copy_expert(sql.SQL("""
+            COPY {staging} (ord, region, game, current_month, previous_month) FROM STDIN WITH (FORMAT csv)
+        """).format(staging=staging), buffer)
+
+        cur.execute(sql.SQL("""
+            INSERT INTO {table} (region, game, current_month, previous_month)
+            SELECT DISTINCT ON (region, game) region, game, current_month, previous_month
+            FROM {staging}
+            ORDER BY region, game, ord DESC
+            {conflict};
+        """).format(table=sql.Identifier(table_name), staging=staging, conflict=self.upsert_conflict_clause()))
+
+    # Insere em lotes com execute_values (melhor para volumes pequenos)
+    def upsert_values(self, cur, table_name, data, page_size=1000):
+        rows = data[UPSERT_COLUMNS].drop_duplicates(subset=['region', 'game'], keep='last')
+        rows = rows.astype(object).where(rows.notna(), None)
+        query = sql.SQL("""
+            INSERT INTO {table} (region, game, current_month, previous_month)
+            VALUES %s
+            {conflict};
+        """).format(table=sql.Identifier(table_name), conflict=self.upsert_conflict_clause())
+        execute_values(cur, query, rows.itertuples(index=False, name=None), page_size=page_size)
+
+    # Insere linha a linha (estratégia original, mantida como referência)
+    def upsert_rows(self, cur, table_name, data):
+        query = sql.SQL("""
+            INSERT INTO {table} (region, game, current_month, previous_month)
+            VALUES (%s, %s, %s, %s)
+            {conflict};
+        """).format(table=sql.Identifier(table_name), conflict=self.upsert_conflict_clause())
+
+        for i, (_, row) in enumerate(data.iterrows()):
+            if i % ROW_LOG_SAMPLE == 0:
+                logger.debug("Inserting row %d of %d: %s, %s", i + 1, len(data), row['region'], row['game'])
+            cur.execute(query, (row['region'], row['game'], row['current_month'], row['previous_month']))
+
+    # Cria a tabela de histórico particionada por mês, com índices para os agrupamentos do dashboard
+    @timer(DB_SECONDS, operation='create_history_table')
+    def create_history_table(self, table_name=HISTORY_TABLE):
+        try:
+            table = sql.Identifier(table_name)
+            with self.cursor() as cur:
+                cur.execute(sql.SQL("""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        region TEXT NOT NULL,
+                        game TEXT NOT NULL,
+                        month DATE NOT NULL,
+                        revenue NUMERIC,
+                        scraped_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                        PRIMARY KEY (region, game, month, scraped_at)
+                    ) PARTITION BY RANGE (month);
+                """).format(table=table))
+                # Índices cobrindo "receita por região/jogo em uma janela de meses" (index-only scan)
+                cur.execute(sql.SQL("""
+                    CREATE INDEX IF NOT EXISTS {region_index} ON {table} (month, region) INCLUDE (revenue);
+                    CREATE INDEX IF NOT EXISTS {game_index} ON {table} (month, game) INCLUDE (revenue);
+                """).format(
+                    table=table,
+                    region_index=sql.Identifier(f"{table_name}_month_region_idx"),
+                    game_index=sql.Identifier(f"{table_name}_month_game_idx")
+                ))
+                self.create_version_table(cur)
+            logger.info("Tabela de histórico '%s' criada com sucesso!", table_name)
+        except Exception as e:
+            logger.error("Erro ao criar tabela de histórico: %s", e)
+
+    # Garante que exista uma partição para cada mês informado
+    def ensure_month_partitions(self, cur, table_name, months):
+        for month in sorted({month_start(month) for month in months}):
+            cur.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+                FOR VALUES FROM (%s) TO (%s);
+            """).format(
+                partition=sql.Identifier(f"{table_name}_{month:%Y_%m}"),
+                table=sql.Identifier(table_name)
+            ), (month, shift_month(month, 1)))
+
+    # Grava linhas já no formato do histórico com um único COPY (criando as partições que faltarem)
+    def copy_history(self, cur, table_name, rows):
+        buffer = io.StringIO()
+        rows[HISTORY_COLUMNS].to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        self.ensure_month_partitions(cur, table_name, rows['month'].unique())
+        cur.copy_expert(sql.SQL("""
+            COPY {table} (region, game, month, revenue, scraped_at) FROM STDIN WITH (FORMAT csv)
+        """).format(table=sql.Identifier(table_name)), buffer)
+        self.bump_data_version(cur, table_name)
+        inc('snapshot_rows_total', len(rows))
+
+    # Grava um snapshot das receitas no histórico; months mapeia coluna -> mês (ex.: {'current_month': date(2024, 10, 1)})
+    @timer(DB_SECONDS, operation='insert_snapshots')
+    def insert_snapshots(self, table_name, data, months, scraped_at=None):
+        try:
+            snapshot = history_frame(data, months, scraped_at)
+            start = time.perf_counter()
+            with self.cursor() as cur:
+                self.copy_history(cur, table_name, snapshot)
+            elapsed = time.perf_counter() - start
+            logger.info("Snapshot gravado no histórico: %d linhas em %.2fs", len(snapshot), elapsed,
+                        extra={'rows': len(snapshot)})
+            return True
+        except Exception as e:
+            logger.error("Erro ao gravar snapshot: %s", e)
+            return False
+
+    # Carga em massa de linhas do histórico (ex.: vários meses de um backfill) em uma única transação
+    @timer(DB_SECONDS, operation='history_bulk_load')
+    def bulk_load_history(self, table_name, rows):
+        try:
+            start = time.perf_counter()
+            with self.cursor() as cur:
+                self.copy_history(cur, table_name, rows)
+            elapsed = time.perf_counter() - start
+            logger.info("Carga em massa no histórico: %d linhas de %d meses em %.2fs", len(rows),
+                        rows['month'].nunique(), elapsed, extra={'rows': len(rows)})
+            return True
+        except Exception as e:
+            logger.error("Erro na carga em massa do histórico: %s", e)
+            return False
+
+    # Copia a tabela atual (formato largo) para o histórico, se ele ainda estiver vazio.
+    # A tabela não guarda a que meses suas colunas se referem: current_month é obrigatório (previous_month é o
+    # mês anterior, se omitido) e, sem ele, a migração é ignorada em vez de rotular os valores com meses errados.
+    @timer(DB_SECONDS, operation='migrate_history')
+    def migrate_to_history(self, source_table='gacha_revenue', target_table=HISTORY_TABLE,
+                           current_month=None, previous_month=None):
+        if current_month is None:
+            logger.info("Migração de '%s' para '%s' ignorada: informe o mês de current_month.",
+                        source_table, target_table)
+            return 0
+        try:
+            current_month = month_start(current_month)
+            previous_month = month_start(previous_month or shift_month(current_month, -1))
+            with self.cursor() as cur:
+                self.ensure_month_partitions(cur, target_table, [current_month, previous_month])
+                cur.execute(sql.SQL("""
+                    INSERT INTO {target} (region, game, month, revenue)
+                    SELECT region, game, month, revenue FROM (
+                        SELECT region, game, %(current)s::date AS month, current_month AS revenue FROM {source}
+                        UNION ALL
+                        SELECT region, game, %(previous)s::date, previous_month FROM {source}
+                    ) AS current_table
+                    WHERE region IS NOT NULL AND game IS NOT NULL
+                      AND NOT EXISTS (SELECT 1 FROM {target})
+                    ON CONFLICT DO NOTHING;
+                """).format(
+                    target=sql.Identifier(target_table), source=sql.Identifier(source_table)
+                ), {'current': current_month, 'previous': previous_month})
+                migrated = cur.rowcount
+                if migrated:
+                    self.bump_data_version(cur, target_table)
+            logger.info("Migração para '%s': %d linhas copiadas de '%s'.", target_table, migrated, source_table)
+            return migrated
+        except Exception as e:
+            logger.error("Erro ao migrar para o histórico: %s", e)
+            return 0
+
+    # Cria a tabela de métricas materializadas (chave region, game, month)
+    @timer(DB_SECONDS, operation='create_metrics_table')
+    def create_metrics_table(self, table_name=METRICS_TABLE):
+        try:
+            table = sql.Identifier(table_name)
+            with self.cursor() as cur:
+                cur.execute(sql.SQL("""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        region TEXT NOT NULL,
+                        game TEXT NOT NULL,
+                        month DATE NOT NULL,
+                        revenue DOUBLE PRECISION,
+                        mom_growth DOUBLE PRECISION,
+                        rolling_avg DOUBLE PRECISION,
+                        rank INTEGER,
+                        rank_change INTEGER,
+                        region_share DOUBLE PRECISION,
+                        computed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                        PRIMARY KEY (region, game, month)
+                    );
+                """).format(table=table))
+                # Cortes transversais (região x mês) lidos no recálculo de rank e participação
+                cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} (month, region);").format(
+                    table=table, index=sql.Identifier(f"{table_name}_month_region_idx")
+                ))
+                self.create_version_table(cur)
+            logger.info("Tabela de métricas '%s' criada com sucesso!", table_name)
+        except Exception as e:
+            logger.error("Erro ao criar tabela de métricas: %s", e)
+
+    # Receita de cada (region, game, month) no histórico (último snapshot de cada mês), opcionalmente só
+    # das séries informadas (DataFrame com region e game)
+    @timer(DB_SECONDS, operation='history_series')
+    def fetch_history_series(self, table_name=HISTORY_TABLE, series=None):
+        try:
+            where, params = sql.SQL("TRUE"), []
+            if series is not None:
+                where = sql.SQL("(region, game) IN (SELECT * FROM unnest(%s::text[], %s::text[]))")
+                params = [series['region'].astype(str).tolist(), series['game'].astype(str).tolist()]
             query = sql.SQL("""
-                INSERT INTO {table} (region, game, current_month, previous_month)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (region, game)  
-                DO UPDATE SET
-                    current_month = EXCLUDED.current_month,  
-                    previous_month = EXCLUDED.previous_month;
-            """).format(table=sql.Identifier(table_name))
+                SELECT DISTINCT ON (region, game, month) region, game, month, revenue::float8 AS revenue
+                FROM {table}
+                WHERE {where}
+                ORDER BY region, game, month, scraped_at DESC
+            """).format(table=sql.Identifier(table_name), where=where)
+            return self.query_frame(query, params)
+        except Exception as e:
+            logger.error("Erro ao buscar séries do histórico: %s", e)
+            return pd.DataFrame(columns=['region', 'game', 'month', 'revenue'])
 
-            # Inserção em massa para otimizar a performance
-            for _, row in data.iterrows():
-                print(f"Inserting: {row['region']}, {row['game']}, {row['current_month']}, {row['previous_month']}")
-                self.cursor.execute(query, (row['region'], row['game'], row['current_month'], row['previous_month']))
-            self.conn.commit()
-            print("Dados inseridos ou atualizados com sucesso!")
+    # Linhas da tabela de métricas nas regiões e meses informados (None = todos)
+    @timer(DB_SECONDS, operation='fetch_metrics')
+    def fetch_metrics(self, table_name=METRICS_TABLE, regions=None, months=None, columns=None):
+        columns = columns or METRIC_COLUMNS
+        conditions, params = [sql.SQL("TRUE")], []
+        if regions is not None:
+            conditions.append(sql.SQL("region = ANY(%s)"))
+            params.append(list(regions))
+        if months is not None:
+            conditions.append(sql.SQL("month = ANY(%s)"))
+            params.append(list(months))
+        query = sql.SQL("SELECT {columns} FROM {table} WHERE {where}").format(
+            columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+            table=sql.Identifier(table_name), where=sql.SQL(' AND ').join(conditions)
+        )
+        try:
+            return self.query_frame(query, params)
+        except Exception as e:
+            logger.error("Erro ao buscar métricas: %s", e)
+            return pd.DataFrame(columns=columns)
+
+    # Grava colunas de métricas por COPY + INSERT ... ON CONFLICT, atualizando só as colunas informadas;
+    # com replace=True a tabela é esvaziada antes (reconstrução completa, na mesma transação)
+    @timer(DB_SECONDS, operation='write_metrics')
+    def write_metrics(self, table_name, data, columns, replace=False):
+        try:
+            keys = ['region', 'game', 'month']
+            columns = [column for column in columns if column not in keys]
+            staging = sql.Identifier(f"{table_name}_staging")
+            buffer = io.StringIO()
+            data[keys + columns].to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+
+            start = time.perf_counter()
+            with self.cursor() as cur:
+                cur.execute(sql.SQL("""
+                    CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;
+                """).format(staging=staging, table=sql.Identifier(table_name)))
+                cur.copy_expert(sql.SQL("COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)").format(
+                    staging=staging, columns=sql.SQL(', ').join(map(sql.Identifier, keys + columns))
+                ), buffer)
+                if replace:
+                    cur.execute(sql.SQL("TRUNCATE {table}").format(table=sql.Identifier(table_name)))
+                cur.execute(sql.SQL("""
+                    INSERT INTO {table} ({columns})
+                    SELECT {columns} FROM {staging}
+                    ON CONFLICT (region, game, month) DO UPDATE SET {updates}, computed_at = now();
+                """).format(
+                    table=sql.Identifier(table_name), staging=staging,
+                    columns=sql.SQL(', ').join(map(sql.Identifier, keys + columns)),
+                    updates=sql.SQL(', ').join(
+                        sql.SQL("{column} = EXCLUDED.{column}").format(column=sql.Identifier(column))
+                        for column in columns
+                    )
+                ))
+                self.bump_data_version(cur, table_name)
+            elapsed = time.perf_counter() - start
+            logger.info("Métricas gravadas em '%s': %d linhas (%s) em %.2fs", table_name, len(data),
+                        ', '.join(columns), elapsed, extra={'rows': len(data)})
+            return True
         except Exception as e:
-            print(f"Erro ao inserir ou atualizar dados: {e}")
+            logger.error("Erro ao gravar métricas: %s", e)
+            return False
 
-    # Busca dados da tabela e retorna como um DataFrame
-    def fetch_data(self, table_name):
+    # Métricas do mês mais recente com os nomes já limpos, para o dashboard (filtros opcionais de região e jogo)
+    @timer(DB_SECONDS, operation='latest_metrics')
+    def fetch_latest_metrics(self, table_name=METRICS_TABLE, regions=None, games=None):
         try:
-            query = sql.SQL("SELECT * FROM {table}").format(table=sql.Identifier(table_name))
-            self.cursor.execute(query)
-            rows = self.cursor.fetchall()
+            keys, _, where, params = self.aggregate_clauses(('region', 'game'), regions, games)
+            query = sql.SQL("""
+                SELECT {columns}
+                FROM {table}
+                WHERE month = (SELECT max(month) FROM {table}) AND {where}
+            """).format(
+                columns=sql.SQL(', ').join(keys + [sql.Identifier(column) for column in METRIC_COLUMNS[2:]]),
+                table=sql.Identifier(table_name), where=where
+            )
+            return self.query_frame(query, params)
+        except Exception as e:
+            logger.error("Erro ao buscar métricas recentes: %s", e)
+            return pd.DataFrame(columns=METRIC_COLUMNS)
 
-            colnames = [desc[0] for desc in self.cursor.description]
-            print(f"Colunas recuperadas: {colnames}") 
+    # Monta um SELECT com colunas e janela de tempo opcionais
+    def build_select(self, table_name, start=None, end=None, time_column='month', columns=None):
+        query = sql.SQL("SELECT {columns} FROM {table}").format(
+            columns=sql.SQL(', ').join(map(sql.Identifier, columns)) if columns else sql.SQL('*'),
+            table=sql.Identifier(table_name)
+        )
+        conditions, params = [], []
+        if start is not None:
+            conditions.append(sql.SQL("{} >= %s").format(sql.Identifier(time_column)))
+            params.append(start)
+        if end is not None:
+            conditions.append(sql.SQL("{} < %s").format(sql.Identifier(time_column)))
+            params.append(end)
+        if conditions:
+            query = sql.SQL(' WHERE ').join([query, sql.SQL(' AND ').join(conditions)])
+        return query, params
 
-            df = pd.DataFrame(rows, columns=colnames)
+    # Lê a tabela em lotes por um cursor nomeado (no servidor), sem trazer tudo de uma vez
+    def stream_data(self, table_name, chunksize=FETCH_CHUNK_SIZE, start=None, end=None, time_column='month',
+                    columns=None):
+        query, params = self.build_select(table_name, start, end, time_column, columns)
+        with self.cursor(name=f"stream_{uuid4().hex}") as cur:
+            cur.itersize = chunksize
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(chunksize)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
 
-            print(f"Dados recuperados do banco de dados: \n{df.head()}")
+    # Busca dados da tabela e retorna como um DataFrame (opcionalmente só uma janela de tempo)
+    @timer(DB_SECONDS, operation='fetch')
+    def fetch_data(self, table_name, start=None, end=None, time_column='month', columns=None,
+                   chunksize=FETCH_CHUNK_SIZE):
+        try:
+            chunks = list(self.stream_data(table_name, chunksize, start, end, time_column, columns))
+            df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            logger.info("Dados recuperados do banco de dados: %d linhas, colunas %s", len(df), list(df.columns),
+                        extra={'rows': len(df)})
+            logger.debug("Primeiras linhas:\n%s", df.head())
 
             return df 
         except Exception as e:
-            print(f"Erro ao buscar dados: {e}")
+            logger.error("Erro ao buscar dados: %s", e)
             return pd.DataFrame() 
 
-    # Fecha a conexão com o banco de dados
+    # Executa uma consulta e devolve o resultado como DataFrame
+    def query_frame(self, query, params=None):
+        with self.cursor() as cur:
+            cur.execute(query, params)
+            return pd.DataFrame(cur.fetchall(), columns=[desc[0] for desc in cur.description])
+
+    # Monta as cláusulas SELECT/GROUP BY/WHERE comuns às agregações
+    def aggregate_clauses(self, group_by, regions=None, games=None):
+        for column in group_by:
+            if column not in GRAPH_KEY_EXPRESSIONS:
+                raise ValueError(f"Agrupamento não suportado: {column}")
+        keys = [sql.SQL("{} AS {}").format(GRAPH_KEY_EXPRESSIONS[column], sql.Identifier(column))
+                for column in group_by]
+        group = sql.SQL("GROUP BY {} ORDER BY {}").format(
+            sql.SQL(', ').join(map(sql.Literal, range(1, len(group_by) + 1))),
+            sql.SQL(', ').join(map(sql.Literal, range(1, len(group_by) + 1)))
+        ) if group_by else sql.SQL('')
+
+        conditions, params = [sql.SQL("TRUE")], []
+        for column, values in (('region', regions), ('game', games)):
+            if values:
+                conditions.append(sql.SQL("{} = ANY(%s)").format(GRAPH_KEY_EXPRESSIONS[column]))
+                params.append(list(values))
+        return keys, group, sql.SQL(' AND ').join(conditions), params
+
+    # Soma as receitas no servidor agrupando por region, game ou game x region (sem agrupamento: totais)
+    @timer(DB_SECONDS, operation='aggregate')
+    def fetch_aggregate(self, table_name, group_by=(), regions=None, games=None):
+        try:
+            keys, group, where, params = self.aggregate_clauses(group_by, regions, games)
+            query = sql.SQL("""
+                SELECT {columns}
+                FROM {table}
+                WHERE {where}
+                {group}
+            """).format(
+                columns=sql.SQL(', ').join(keys + [
+                    sql.SQL("COUNT(*) AS count"),
+                    sql.SQL("COALESCE(SUM(current_month), 0)::float8 AS current_month"),
+                    sql.SQL("COALESCE(SUM(previous_month), 0)::float8 AS previous_month")
+                ]),
+                table=sql.Identifier(table_name), where=where, group=group
+            )
+            return self.query_frame(query, params)
+        except Exception as e:
+            logger.error("Erro ao agregar dados: %s", e)
+            return pd.DataFrame()
+
+    # Soma as receitas do histórico (último snapshot de cada série) por month, region e/ou game
+    @timer(DB_SECONDS, operation='history_aggregate')
+    def fetch_history_aggregate(self, table_name=HISTORY_TABLE, group_by=('month',), start=None, end=None,
+                                regions=None, games=None):
+        try:
+            keys, group, where, params = self.aggregate_clauses(group_by, regions, games)
+            window, window_params = self.build_select(table_name, start, end, 'month',
+                                                      ['region', 'game', 'month', 'revenue', 'scraped_at'])
+            query = sql.SQL("""
+                SELECT {columns}
+                FROM (
+                    SELECT DISTINCT ON (region, game, month) region, game, month, revenue
+                    FROM ({window}) AS snapshots
+                    ORDER BY region, game, month, scraped_at DESC
+                ) AS latest
+                WHERE {where}
+                {group}
+            """).format(
+                columns=sql.SQL(', ').join(keys + [
+                    sql.SQL("COUNT(*) AS count"),
+                    sql.SQL("COALESCE(SUM(revenue), 0)::float8 AS revenue")
+                ]),
+                window=window, where=where, group=group
+            )
+            return self.query_frame(query, window_params + params)
+        except Exception as e:
+            logger.error("Erro ao agregar histórico: %s", e)
+            return pd.DataFrame()
+
+    # Receita total de cada mês no histórico
+    def fetch_monthly_totals(self, table_name=HISTORY_TABLE, start=None, end=None):
+        return self.fetch_history_aggregate(table_name, ('month',), start, end)
+
+    # Fecha todas as conexões do pool
     def close_connection(self):
-        if self.cursor:
-            self.cursor.close()
-        if self.conn:
-            self.conn.close()
-        print("Conexão encerrada.")
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+        logger.info("Conexão encerrada.")
@@ -0,0 +1,228 @@
+import argparse
+import logging
+import time
+import weakref
+
+import pandas as pd
+
+from Analytics import ensure_metrics, rebuild_metrics, update_metrics
+from GameScraping import BACKENDS, CHUNK_SIZE, GachaRevenueScraper
+from Metrics import ETL_SECONDS, configure_logging, inc, serve_metrics, timer
+from ScrapeState import ScrapeStateStore
+from SnapshotStore import SNAPSHOT_DIR, SnapshotStore
+from db import DB_CONFIG, HISTORY_TABLE, METRICS_TABLE, REVENUE_TABLE, PostgreSQLDatabase
+
+logger = logging.getLogger('etl')
+
+URL = "https://www.gacharevenue.com/revenue"
+
+# Intervalos padrão (segundos): entre coletas, primeira nova tentativa após falha e teto do backoff
+ETL_INTERVAL = 3600
+RETRY_DELAY = 30
+MAX_BACKOFF = 1800
+
+# Bancos já preparados neste processo (a preparação roda uma vez, na primeira coleta em que o banco responder)
+PREPARED = weakref.WeakSet()
+
+
+# Prepara as tabelas usadas pelo pipeline (as métricas são calculadas do histórico na primeira vez)
+def prepare_database(db):
+    db.create_table(REVENUE_TABLE)
+    db.create_history_table(HISTORY_TABLE)
+    ensure_metrics(db, HISTORY_TABLE, METRICS_TABLE)
+
+
+# Migração única da tabela atual (formato largo) para o histórico vazio; current_month é o mês real da coluna
+# current_month da tabela. As métricas são recalculadas se alguma linha foi copiada.
+def migrate_legacy(db, current_month):
+    db.connect()
+    prepare_database(db)
+    migrated = db.migrate_to_history(REVENUE_TABLE, HISTORY_TABLE, current_month)
+    if migrated:
+        rebuild_metrics(db, HISTORY_TABLE, METRICS_TABLE)
+    return migrated
+
+
+# Conecta e prepara o banco se ainda não foi feito; se ele estiver fora do ar a exceção sobe e a próxima
+# coleta tenta de novo (com o backoff de run_forever). Com rebuild, recalcula as métricas depois de preparar.
+def ensure_database(db, rebuild=False):
+    if db in PREPARED:
+        return
+    db.connect()
+    prepare_database(db)
+    if rebuild:
+        rebuild_metrics(db, HISTORY_TABLE, METRICS_TABLE)
+    PREPARED.add(db)
+
+
+# Executa uma coleta (raspa, limpa e grava no banco); retorna o número de linhas gravadas.
+# Com snapshots, a tabela limpa é salva localmente antes do banco, servindo de reserva se ele estiver fora do ar.
+def run_etl(db, url=URL, backend='auto', state_store=None, snapshots=None, rebuild=False):
+    scraper = GachaRevenueScraper(url, backend=backend, state_store=state_store)
+    try:
+        scraper.fetch_data(display=False)
+        if scraper.unchanged:
+            logger.info("Site sem alterações desde a última coleta.")
+            return 0
+
+        data = scraper.get_data()
+        if data.empty:
+            raise ValueError("Nenhum dado foi extraído do site.")
+        logger.info("Dados extraídos: %s", data.shape, extra={'rows': len(data)})
+        if snapshots is not None:
+            snapshots.write(data, url, scraper.months)
+
+        ensure_database(db, rebuild)
+        changed_data = scraper.get_changed_data()
+        if not changed_data.empty and not (
+            db.insert_or_update_data(REVENUE_TABLE, changed_data)
+            and db.insert_snapshots(HISTORY_TABLE, changed_data, scraper.months)
+        ):
+            raise RuntimeError("Falha ao gravar os dados no banco.")
+        # Só as séries alteradas (e os rankings das suas regiões) são recalculados
+        update_metrics(db, changed_data, scraper.months.values())
+        scraper.commit_state()
+        return len(changed_data)
+    finally:
+        scraper.close_driver()
+
+
+# Coleta em modo streaming: cada lote é limpo e gravado antes do próximo ser lido, com memória limitada.
+# Cada lote é gravado em sua própria transação e com seu próprio scraped_at no histórico.
+# Se o banco estiver fora do ar no início, a coleta vai só para o snapshot e a execução falha no fim (nova tentativa).
+def run_etl_stream(db, url=URL, backend='auto', state_store=None, snapshots=None, chunk_size=CHUNK_SIZE,
+                   rebuild=False):
+    scraper = GachaRevenueScraper(url, backend=backend, state_store=state_store)
+    snapshot = snapshots.writer(url) if snapshots is not None else None
+    try:
+        db_error = None
+        try:
+            ensure_database(db, rebuild)
+        except Exception as e:
+            if snapshot is None:
+                raise
+            db_error = e
+            logger.warning("Banco indisponível (%s); a coleta será gravada só no snapshot local.", e)
+
+        rows, series = 0, []
+        for chunk in scraper.iter_data(chunk_size):
+            if snapshot is not None:
+                snapshot.write(chunk)
+            if db_error is None:
+                if not (
+                    db.insert_or_update_data(REVENUE_TABLE, chunk)
+                    and db.insert_snapshots(HISTORY_TABLE, chunk, scraper.months)
+                ):
+                    raise RuntimeError(f"Falha ao gravar o lote após {rows} linhas.")
+                series.append(chunk[['region', 'game']])
+            rows += len(chunk)
+            logger.info("Lote gravado: %d linhas (%d no total).", len(chunk), rows, extra={'rows': len(chunk)})
+
+        if scraper.unchanged:
+            logger.info("Site sem alterações desde a última coleta.")
+            return 0
+        if not rows:
+            raise ValueError("Nenhum dado foi extraído do site.")
+        if snapshot is not None:
+            snapshot.months = scraper.months
+            snapshot.commit()
+        if db_error is not None:
+            raise RuntimeError(f"Banco indisponível; {rows} linhas gravadas só no snapshot local ({db_error}).")
+        # Métricas atualizadas uma vez no fim, com as séries de todos os lotes
+        update_metrics(db, pd.concat(series, ignore_index=True), scraper.months.values())
+        scraper.commit_state()
+        return rows
+    finally:
+        if snapshot is not None:
+            snapshot.abort()
+        scraper.close_driver()
+
+
+# Executa uma coleta medindo a duração e contando o resultado
+def timed_run(etl, db, **etl_options):
+    mode = 'stream' if etl is run_etl_stream else 'full'
+    try:
+        with timer(ETL_SECONDS, mode=mode):
+            rows = etl(db, **etl_options)
+    except Exception:
+        inc('etl_runs_total', mode=mode, status='error')
+        raise
+    inc('etl_runs_total', mode=mode, status='ok')
+    logger.info("Coleta concluída: %d linhas gravadas.", rows, extra={'rows': rows})
+    return rows
+
+
+# Roda o ETL em intervalo fixo; após falhas, tenta de novo com backoff exponencial
+def run_forever(db, interval=ETL_INTERVAL, retry_delay=RETRY_DELAY, max_backoff=MAX_BACKOFF, etl=run_etl,
+                **etl_options):
+    failures = 0
+    while True:
+        try:
+            timed_run(etl, db, **etl_options)
+            failures = 0
+            delay = interval
+        except Exception as e:
+            failures += 1
+            delay = min(max_backoff, retry_delay * 2 ** (failures - 1))
+            logger.error("Erro na coleta (%dª falha seguida): %s", failures, e)
+        logger.info("Próxima coleta em %.0fs...", delay)
+        time.sleep(delay)
+
+
+def main(argv=None):
+    from backfill import parse_month
+
+    parser = argparse.ArgumentParser(description="Worker de coleta: scrape -> limpeza -> upsert no banco.")
+    parser.add_argument('--url', default=URL)
+    parser.add_argument('--backend', default='auto', choices=BACKENDS)
+    parser.add_argument('--interval', type=float, default=ETL_INTERVAL, help="Segundos entre coletas.")
+    parser.add_argument('--retry-delay', type=float, default=RETRY_DELAY)
+    parser.add_argument('--max-backoff', type=float, default=MAX_BACKOFF)
+    parser.add_argument('--once', action='store_true', help="Executa uma única coleta e sai.")
+    parser.add_argument('--stream', action='store_true',
+                        help="Lê, limpa e grava a tabela em lotes (memória limitada para tabelas muito grandes).")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Linhas por lote no modo --stream.")
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR,
+                        help="Diretório dos snapshots Parquet de cada coleta (reserva local do banco; padrão: "
+                             "$SNAPSHOT_DIR ou snapshots). O dashboard precisa usar o mesmo.")
+    parser.add_argument('--no-snapshots', action='store_true', help="Não grava snapshots locais.")
+    parser.add_argument('--rebuild-metrics', action='store_true',
+                        help="Recalcula toda a tabela de métricas a partir do histórico antes da primeira gravação.")
+    parser.add_argument('--migrate-legacy', type=parse_month, metavar='AAAA-MM',
+                        help="Copia a tabela atual para o histórico vazio, com current_month no mês informado e "
+                             "previous_month no anterior, e sai.")
+    parser.add_argument('--metrics-port', type=int, help="Expõe as métricas do worker em :PORT/metrics.")
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--plain-logs', action='store_true', help="Log em texto simples em vez de JSON.")
+    args = parser.parse_args(argv)
+
+    configure_logging(args.log_level, structured=not args.plain_logs)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    # O banco é conectado e preparado dentro de cada coleta, depois do snapshot: se ele estiver fora do ar na
+    # partida, o worker continua coletando para o snapshot e tenta o banco de novo na próxima execução
+    db = PostgreSQLDatabase(DB_CONFIG)
+    try:
+        if args.migrate_legacy:
+            migrate_legacy(db, args.migrate_legacy)
+            return
+        options = {
+            'url': args.url, 'backend': args.backend, 'state_store': ScrapeStateStore(),
+            'snapshots': None if args.no_snapshots else SnapshotStore(args.snapshot_dir),
+            'rebuild': args.rebuild_metrics
+        }
+        etl = run_etl
+        if args.stream:
+            etl = run_etl_stream
+            options['chunk_size'] = args.chunk_size
+        if args.once:
+            timed_run(etl, db, **options)
+        else:
+            run_forever(db, args.interval, args.retry_delay, args.max_backoff, etl, **options)
+    finally:
+        db.close_connection()
+
+
+if __name__ == '__main__':
+    main()
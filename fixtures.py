@@ -0,0 +1,217 @@
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date
+from functools import partial
+from html import escape
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+# Diretório com as páginas HTML salvas usadas nos benchmarks
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'html_fixtures')
+
+# Tamanhos das páginas salvas em html_fixtures (o mesmo seed gera sempre o mesmo HTML)
+FIXTURE_SIZES = (300, 3_000, 10_000)
+
+REGION_FLAGS = ['🇯🇵', '🇨🇳', '🇰🇷', '🇺🇸', '🌐']
+TABLE_HEADERS = ['#', 'Region', 'Game', 'Sep 2024', 'Oct 2024', '', '']
+
+
+# Cabeçalhos da tabela na visão de um mês (o anterior e o próprio mês), ex.: month=date(2024, 10, 1)
+def table_headers(month=None):
+    if month is None:
+        return TABLE_HEADERS
+    previous = date(month.year - (month.month == 1), (month.month - 2) % 12 + 1, 1)
+    return ['#', 'Region', 'Game', f"{previous:%b %Y}", f"{month:%b %Y}", '', '']
+
+
+# Gera valores monetários no formato exibido pelo site
+def format_revenue(rng):
+    if rng.random() < 0.02:
+        return '☠️'
+    return f"${rng.randint(10_000, 250_000_000):,}"
+
+
+# Gera o HTML de uma linha da tabela de receitas
+def revenue_row_html(i, rng):
+    return (
+        '<tr>'
+        f'<td>{i + 1}</td>'
+        f'<td>{rng.choice(REGION_FLAGS)}</td>'
+        f'<td><div>Game {i:05d}</div><div class="dev">Studio {rng.randint(1, 400)}</div></td>'
+        f'<td>{format_revenue(rng)}</td>'
+        f'<td>{format_revenue(rng)}</td>'
+        f'<td><span>{rng.choice(["▲", "▼"])}</span></td>'
+        f'<td>{rng.randint(-90, 300)}%</td>'
+        '</tr>'
+    )
+
+
+# Gera o HTML de uma tabela de receitas com o mesmo layout do gacharevenue
+def build_revenue_table_html(n_rows, seed=0, month=None):
+    rng = random.Random(seed)
+    lines = ['<table class="revenue">', '<thead><tr>']
+    lines.extend(f'<th>{escape(header)}</th>' for header in table_headers(month))
+    lines.append('</tr></thead>')
+    lines.append('<tbody>')
+    lines.extend(revenue_row_html(i, rng) for i in range(n_rows))
+    lines.append('</tbody></table>')
+    return '\n'.join(lines)
+
+
+# Gera uma página completa contendo a tabela
+def build_revenue_page_html(n_rows, seed=0, month=None):
+    return (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Gacha Revenue</title></head>\n'
+        f'<body>\n{build_revenue_table_html(n_rows, seed, month)}\n</body></html>\n'
+    )
+
+
+# Grava em directory uma página por mês (revenue_2024-10.html...), simulando as visões históricas do site;
+# retorna o modelo do nome do arquivo para montar a URL de cada mês
+def write_month_pages(directory, months, n_rows=300):
+    os.makedirs(directory, exist_ok=True)
+    for i, month in enumerate(months):
+        with open(os.path.join(directory, f'revenue_{month:%Y-%m}.html'), 'w', encoding='utf-8') as f:
+            f.write(build_revenue_page_html(n_rows, seed=i, month=month))
+    return 'revenue_{month:%Y-%m}.html'
+
+
+# Gera a mesma página em pedaços de rows_per_fragment linhas, sem montá-la inteira (tabelas de milhões de linhas)
+def iter_revenue_page_html(n_rows, seed=0, rows_per_fragment=1000):
+    rng = random.Random(seed)
+    headers = ''.join(f'<th>{escape(header)}</th>' for header in TABLE_HEADERS)
+    yield (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Gacha Revenue</title></head>\n'
+        f'<body>\n<table class="revenue">\n<thead><tr>{headers}</tr></thead>\n<tbody>\n'
+    )
+    for start in range(0, n_rows, rows_per_fragment):
+        yield '\n'.join(revenue_row_html(i, rng) for i in range(start, min(start + rows_per_fragment, n_rows))) + '\n'
+    yield '</tbody></table>\n</body></html>\n'
+
+
+# Gera um DataFrame bruto, como saído de extract_table, com n linhas
+def build_raw_revenue_frame(n_rows, n_games=5000, seed=0):
+    rng = np.random.default_rng(seed)
+
+    def revenue_strings():
+        values = rng.integers(10_000, 250_000_000, size=n_rows)
+        strings = np.array([f"${value:,}" for value in values.tolist()], dtype=object)
+        strings[rng.random(n_rows) < 0.02] = '☠️'
+        return strings
+
+    games = np.array([f"Game {i:05d}\nStudio {i % 400}" for i in range(n_games)], dtype=object)
+    return pd.DataFrame({
+        '#': np.arange(1, n_rows + 1).astype(str),
+        'Region': np.array(REGION_FLAGS, dtype=object)[rng.integers(0, len(REGION_FLAGS), size=n_rows)],
+        'Game': games[rng.integers(0, n_games, size=n_rows)],
+        'Last Month': revenue_strings(),
+        'Current Month': revenue_strings()
+    })
+
+
+# Gera um histórico em formato longo (region, game, month, revenue) com n_series séries de n_months meses,
+# com ~5% dos meses faltando para exercitar as lacunas
+def build_history_frame(n_series, n_months=24, seed=0, start=date(2023, 1, 1)):
+    rng = np.random.default_rng(seed)
+    months = pd.date_range(start, periods=n_months, freq='MS').date
+    series = np.repeat(np.arange(n_series), n_months)
+    history = pd.DataFrame({
+        'region': np.array(['jp', 'cn', 'kr', 'us', 'WW'], dtype=object)[series % 5],
+        'game': np.array([f"Game {i:06d}" for i in range(n_series)], dtype=object)[series],
+        'month': np.tile(months, n_series),
+        'revenue': rng.integers(10_000, 250_000_000, size=n_series * n_months).astype('float64')
+    })
+    return history[rng.random(len(history)) >= 0.05].reset_index(drop=True)
+
+
+# Caminho da página salva com n linhas (gera o arquivo se ainda não existir)
+def revenue_page_path(n_rows, seed=0):
+    path = os.path.join(FIXTURES_DIR, f'revenue_{n_rows}.html')
+    if not os.path.exists(path):
+        os.makedirs(FIXTURES_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(build_revenue_page_html(n_rows, seed))
+    return path
+
+
+# Gera (ou regenera, com overwrite=True) as páginas salvas de todos os tamanhos
+def build_fixture_pages(sizes=FIXTURE_SIZES, seed=0, overwrite=False):
+    paths = []
+    for n_rows in sizes:
+        path = os.path.join(FIXTURES_DIR, f'revenue_{n_rows}.html')
+        if overwrite and os.path.exists(path):
+            os.remove(path)
+        paths.append(revenue_page_path(n_rows, seed))
+    return paths
+
+
+# Handler que serve o diretório de fixtures sem imprimir cada requisição
+class QuietFixtureHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# Sobe um servidor HTTP local servindo as páginas salvas; retorna a URL base
+@contextmanager
+def serve_fixtures(directory=FIXTURES_DIR):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietFixtureHandler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# Postgres descartável para os benchmarks; retorna a DSN (ou None se nenhum estiver disponível).
+# Usa BENCH_PG_DSN se definido; senão o pacote opcional pgserver; senão initdb/pg_ctl do PATH.
+# O cluster temporário é apagado na saída.
+@contextmanager
+def disposable_postgres():
+    dsn = os.environ.get('BENCH_PG_DSN')
+    if dsn:
+        yield dsn
+        return
+
+    directory = tempfile.mkdtemp(prefix='bench_pg_')
+    try:
+        try:
+            import pgserver
+        except ImportError:
+            pgserver = None
+
+        if pgserver is not None:
+            server = pgserver.get_server(directory, cleanup_mode='stop')
+            try:
+                yield server.get_uri()
+            finally:
+                server.cleanup()
+        elif shutil.which('initdb') and shutil.which('pg_ctl'):
+            data_dir = os.path.join(directory, 'data')
+            subprocess.run(['initdb', '-D', data_dir, '-U', 'postgres', '-A', 'trust'],
+                           check=True, capture_output=True)
+            subprocess.run(['pg_ctl', '-D', data_dir, '-w', '-l', os.path.join(directory, 'postgres.log'),
+                            '-o', f"-k {directory} -c listen_addresses=''", 'start'],
+                           check=True, capture_output=True)
+            try:
+                yield f"postgresql://postgres@/postgres?host={directory}"
+            finally:
+                subprocess.run(['pg_ctl', '-D', data_dir, '-m', 'immediate', 'stop'], capture_output=True)
+        else:
+            yield None
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # Regenera as páginas salvas em html_fixtures
+    for path in build_fixture_pages(overwrite=True):
+        print(f"{path}: {os.path.getsize(path) / 1e6:.2f} MB")
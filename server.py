@@ -0,0 +1,58 @@
+import argparse
+import logging
+
+from ChartCache import CHART_CACHE_DIR, FigureCache
+from DashBoard import REFRESH_INTERVAL, create_app
+from db import DB_CONFIG, METRICS_TABLE, REVENUE_TABLE, PostgreSQLDatabase
+from Metrics import configure_logging
+from SnapshotStore import SNAPSHOT_DIR, SnapshotStore
+
+# Log estruturado também quando importado por um servidor WSGI que não configurou o logging
+if not logging.getLogger().handlers:
+    configure_logging()
+
+# O dashboard só lê do banco (ou, com ele fora do ar, dos snapshots locais gravados pelo ETL);
+# a coleta roda à parte em etl.py.
+# O pool de conexões é criado no primeiro acesso, então cada worker do servidor WSGI abre o seu.
+db = PostgreSQLDatabase(DB_CONFIG)
+
+
+# Cria o app com os diretórios de snapshots (o mesmo do --snapshot-dir do ETL) e do cache de figuras
+def build_app(snapshot_dir=SNAPSHOT_DIR, chart_cache_dir=CHART_CACHE_DIR):
+    return create_app(
+        db=db, table_name=REVENUE_TABLE, refresh_interval=REFRESH_INTERVAL,
+        cache=FigureCache(cache_dir=chart_cache_dir), snapshots=SnapshotStore(snapshot_dir), metrics_table=METRICS_TABLE
+    )
+
+
+# Sob WSGI os diretórios vêm das variáveis de ambiente SNAPSHOT_DIR e CHART_CACHE_DIR
+app = build_app()
+
+# Ponto de entrada WSGI para produção, ex.: gunicorn --workers 4 --bind 0.0.0.0:8050 server:server
+# (as métricas em /metrics são de cada processo worker)
+server = app.server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor do dashboard (somente leitura do banco).")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR,
+                        help="Diretório dos snapshots gravados pelo ETL, usados com o banco fora do ar "
+                             "(o mesmo do --snapshot-dir do etl.py; padrão: $SNAPSHOT_DIR ou snapshots).")
+    parser.add_argument('--chart-cache-dir', default=CHART_CACHE_DIR,
+                        help="Diretório do cache de figuras em disco (padrão: $CHART_CACHE_DIR ou .chart_cache).")
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--plain-logs', action='store_true', help="Log em texto simples em vez de JSON.")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level, structured=not args.plain_logs)
+
+    dashboard = app
+    if (args.snapshot_dir, args.chart_cache_dir) != (SNAPSHOT_DIR, CHART_CACHE_DIR):
+        dashboard = build_app(args.snapshot_dir, args.chart_cache_dir)
+    # Servidor embutido, sem debug/reloader; em produção use um servidor WSGI com vários workers
+    dashboard.run(host=args.host, port=args.port, debug=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import os
+
+import pandas as pd
+import pytest
+import requests
+
+from GameScraping import GachaRevenueScraper, build_table_dataframe, parse_table_html
+from ScrapeState import ScrapeStateStore
+from fixtures import revenue_page_path, serve_fixtures
+
+PAGE_ROWS = 300
+
+
+# Página salva servida por um servidor HTTP local (sem rede externa nem Chrome)
+@pytest.fixture(scope='module')
+def page_url():
+    page = os.path.basename(revenue_page_path(PAGE_ROWS))
+    with serve_fixtures() as base_url:
+        yield f"{base_url}/{page}"
+
+
+# Diretório servido com uma página sem <table> (ex.: tabela montada por JavaScript)
+@pytest.fixture
+def page_without_table(tmp_path):
+    (tmp_path / 'spa.html').write_text("<html><body><div id='app'></div></body></html>", encoding='utf-8')
+    with serve_fixtures(str(tmp_path)) as base_url:
+        yield f"{base_url}/spa.html"
+
+
+def test_http_backend_matches_saved_page(page_url):
+    scraper = GachaRevenueScraper(page_url, backend='http')
+    try:
+        scraper.start_driver()
+        scraper.extract_table()
+    finally:
+        scraper.close_driver()
+
+    with open(revenue_page_path(PAGE_ROWS), encoding='utf-8') as f:
+        expected = build_table_dataframe(*parse_table_html(f.read()))
+    assert scraper.driver is None
+    assert len(scraper.table_data) == PAGE_ROWS
+    pd.testing.assert_frame_equal(scraper.table_data, expected)
+
+
+def test_auto_backend_falls_back_to_browser_without_table(page_without_table, monkeypatch):
+    opened = []
+    monkeypatch.setattr(GachaRevenueScraper, 'start_browser', lambda self: opened.append(self.url))
+
+    GachaRevenueScraper(page_without_table, backend='auto').start_driver()
+    assert opened == [page_without_table]
+
+
+def test_http_backend_does_not_fall_back_without_table(page_without_table, monkeypatch):
+    monkeypatch.setattr(GachaRevenueScraper, 'start_browser', lambda self: pytest.fail("Chrome não deveria abrir"))
+
+    with pytest.raises(ValueError):
+        GachaRevenueScraper(page_without_table, backend='http').start_driver()
+
+
+def test_http_backend_raises_on_404(page_url):
+    scraper = GachaRevenueScraper(page_url.rsplit('/', 1)[0] + '/missing.html', backend='http')
+    with pytest.raises(requests.HTTPError) as error:
+        scraper.start_driver()
+    assert error.value.response.status_code == 404
+
+
+def test_conditional_get_marks_unchanged_on_304(page_url, tmp_path):
+    state_store = ScrapeStateStore(str(tmp_path / 'scrape_state.json'))
+    first = GachaRevenueScraper(page_url, backend='http', state_store=state_store)
+    first.fetch_data(display=False)
+    assert not first.unchanged
+    first.commit_state()
+    assert state_store.get(page_url).get('last_modified')
+
+    # Segunda coleta envia If-Modified-Since; o servidor responde 304 e a página nem é baixada
+    second = GachaRevenueScraper(page_url, backend='http', state_store=state_store)
+    second.fetch_data(display=False)
+    assert second.unchanged
+    assert second.page_html is None
+    assert second.table_data is None
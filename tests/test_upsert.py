@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from db import PostgreSQLDatabase
+from fixtures import disposable_postgres
+
+STRATEGIES = ('copy', 'values', 'row')
+
+
+# Banco temporário compartilhado pelos testes (pulados se não houver PostgreSQL disponível)
+@pytest.fixture(scope='module')
+def db():
+    with disposable_postgres() as dsn:
+        if dsn is None:
+            pytest.skip("PostgreSQL indisponível (defina BENCH_PG_DSN ou instale pgserver/initdb).")
+        database = PostgreSQLDatabase({'dsn': dsn})
+        try:
+            yield database
+        finally:
+            database.close_connection()
+
+
+# Tabela limpa com chaves repetidas (a última ocorrência deve prevalecer) e receitas faltando
+def revenue_frame(n_rows, seed):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'region': rng.choice(['Global', 'Japan', 'Korea', 'China'], size=n_rows),
+        'game': [f"Game {i}" for i in rng.integers(0, n_rows // 2, size=n_rows)],
+        'current_month': rng.integers(10_000, 250_000_000, size=n_rows).astype(float),
+        'previous_month': rng.integers(10_000, 250_000_000, size=n_rows).astype(float),
+    })
+    data.loc[rng.random(n_rows) < 0.05, 'current_month'] = np.nan
+    return data
+
+
+# Conteúdo da tabela ordenado no pandas (a ordenação do banco depende da collation)
+def table_contents(db, table_name):
+    data = db.query_frame(f"SELECT region, game, current_month, previous_month FROM {table_name}")
+    data = data.astype({'current_month': float, 'previous_month': float})
+    return data.sort_values(['region', 'game'], ignore_index=True)
+
+
+def test_upsert_strategies_write_identical_tables(db):
+    first = revenue_frame(2_000, seed=1)
+    # Segunda coleta: metade das linhas repetidas com novos valores e novas linhas
+    second = pd.concat([first.sample(frac=0.5, random_state=2), revenue_frame(1_000, seed=3)], ignore_index=True)
+    second['current_month'] = second['current_month'] * 1.5
+
+    tables = {strategy: f"upsert_test_{strategy}" for strategy in STRATEGIES}
+    with db.cursor() as cur:
+        for table_name in tables.values():
+            cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+    for table_name in tables.values():
+        db.create_table(table_name)
+
+    written = []
+    for data in (first, second):
+        for strategy, table_name in tables.items():
+            assert db.insert_or_update_data(table_name, data.copy(), strategy=strategy)
+            assert db.last_upsert_stats['strategy'] == strategy
+
+        # Estado esperado: a última ocorrência de cada (region, game) entre tudo o que já foi gravado
+        written.append(data)
+        expected = pd.concat(written, ignore_index=True).drop_duplicates(subset=['region', 'game'], keep='last')
+        expected = expected.sort_values(['region', 'game'], ignore_index=True)
+        for table_name in tables.values():
+            pd.testing.assert_frame_equal(table_contents(db, table_name), expected)